@@ -1,20 +1,25 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, AsyncIterator, Set, Dict, Any
 import json
+import orjson
 import os
+import re
+import sys
 import asyncio
 import logging
+import time
 from contextlib import asynccontextmanager
 
 # Import our modules
-from models.device import Device, DeviceStatus, SensorReading
+from models.device import Device, SensorReading
 from models.log import LogEntry, LogLevel
 from services.mixed_communication_service import MixedCommunicationService
-from services.database_service import DatabaseService
+from services.database_service import DatabaseService, LOGS_MAX_LIMIT
 from services.device_service import DeviceService
 from services.config_service import config
 
@@ -28,6 +33,15 @@ communication_service = None
 db_service = None
 device_service = None
 
+# Short-lived system status cache so concurrent API and WebSocket clients
+# share one get_all_devices() computation
+STATUS_CACHE_TTL = 2.0
+_status_cache = {"value": None, "payload": None, "expires": 0.0, "lock": asyncio.Lock()}
+
+# Connected WebSocket clients, fed by a single status broadcaster task
+STATUS_BROADCAST_INTERVAL = 5
+_ws_clients: Set[WebSocket] = set()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
@@ -47,10 +61,18 @@ async def lifespan(app: FastAPI):
     device_service = DeviceService(db_service, communication_service)
     await device_service.initialize()
     
-    logger.info("Application started successfully with mixed communication support")
-    yield
+    # Device monitoring runs until the app shuts down
+    async with device_service.running():
+        # Push status updates to WebSocket clients
+        broadcaster = asyncio.create_task(_status_broadcaster())
+        
+        logger.info("Application started successfully with mixed communication support")
+        logger.info(f"Event loop: {type(asyncio.get_running_loop()).__module__}")
+        yield
+        
+        # Shutdown
+        broadcaster.cancel()
     
-    # Shutdown
     if communication_service:
         await communication_service.disconnect()
     if db_service:
@@ -61,7 +83,8 @@ app = FastAPI(
     title="IoT Home Automation API",
     description="Backend API for home IoT device management",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -88,30 +111,62 @@ class ApiResponse(BaseModel):
     message: str
     data: Optional[dict] = None
 
+class BatchRequestItem(BaseModel):
+    path: str
+    params: Dict[str, Any] = {}
+
+class BatchRequest(BaseModel):
+    requests: List[BatchRequestItem]
+
+class LogsQuery(BaseModel):
+    """Query parameters of /api/logs, for validating batched requests"""
+    limit: int = 100
+    device_id: Optional[str] = None
+    cursor: Optional[int] = None
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
-# System status endpoint
-@app.get("/api/status", response_model=SystemStatus)
-async def get_system_status():
-    try:
+async def _get_cached_status() -> dict:
+    """Return the cached status entry, recomputing it once the TTL expires"""
+    if time.monotonic() < _status_cache["expires"]:
+        return _status_cache
+    
+    async with _status_cache["lock"]:
+        # Another waiter may have refreshed the cache while we were queued
+        if time.monotonic() < _status_cache["expires"]:
+            return _status_cache
+        
         devices = await device_service.get_all_devices()
-        return SystemStatus(
+        status = SystemStatus(
             status="online",
             devices=devices,
             last_updated=datetime.now()
         )
+        _status_cache["value"] = status
+        _status_cache["payload"] = orjson.dumps(status.model_dump()).decode()
+        _status_cache["expires"] = time.monotonic() + STATUS_CACHE_TTL
+        return _status_cache
+
+# System status endpoint
+@app.get("/api/status", response_model=SystemStatus)
+async def get_system_status():
+    try:
+        return (await _get_cached_status())["value"]
     except Exception as e:
         logger.error(f"Error getting system status: {e}")
         raise HTTPException(status_code=500, detail="Failed to get system status")
 
 # Device endpoints
-@app.get("/api/devices", response_model=List[Device])
+# List endpoints return models we just built from the database, so skip
+# response_model re-validation and serialize them once with orjson
+@app.get("/api/devices", response_model=None)
 async def get_devices():
     try:
-        return await device_service.get_all_devices()
+        devices = await device_service.get_all_devices()
+        return ORJSONResponse([device.model_dump() for device in devices])
     except Exception as e:
         logger.error(f"Error getting devices: {e}")
         raise HTTPException(status_code=500, detail="Failed to get devices")
@@ -195,21 +250,46 @@ async def get_latest_sensor_data(device_id: str):
         logger.error(f"Error getting sensor data for {device_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to get sensor data")
 
-@app.get("/api/sensors/{device_id}/history")
+async def _stream_json_array(first: Optional[dict], items: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """Encode first followed by an async stream of dicts as a JSON array, one chunk per item"""
+    yield b"["
+    try:
+        if first is not None:
+            yield orjson.dumps(first)
+            async for item in items:
+                yield b"," + orjson.dumps(item)
+    except Exception as e:
+        # Headers are already sent; log and abort the response rather than
+        # closing the array, so the client doesn't take it for complete
+        logger.error(f"Error streaming JSON array: {e}")
+        raise
+    yield b"]"
+
+@app.get("/api/sensors/{device_id}/history", response_model=None)
 async def get_sensor_history(device_id: str, hours: int = 24):
     try:
-        readings = await device_service.get_sensor_history(device_id, hours)
-        return readings
+        readings = device_service.get_sensor_history(device_id, hours)
+        # Pull the first item here so query errors become a 500 before the
+        # streaming response sends its headers
+        first = await anext(readings, None)
     except Exception as e:
         logger.error(f"Error getting sensor history for {device_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to get sensor history")
+    return StreamingResponse(_stream_json_array(first, readings), media_type="application/json")
 
 # Logs endpoints
-@app.get("/api/logs", response_model=List[LogEntry])
-async def get_logs(limit: int = 100, device_id: Optional[str] = None):
+async def _get_logs_page(limit: int, device_id: Optional[str], cursor: Optional[int]) -> dict:
+    """Fetch one page of logs plus the cursor for the next, older page"""
+    limit = max(0, min(limit, LOGS_MAX_LIMIT))
+    logs = await db_service.get_logs(limit=limit, device_id=device_id, cursor=cursor)
+    # A short page means there is nothing older left to fetch
+    next_cursor = logs[-1].id if logs and len(logs) >= limit else None
+    return {"items": [log.model_dump() for log in logs], "next_cursor": next_cursor}
+
+@app.get("/api/logs", response_model=None)
+async def get_logs(limit: int = 100, device_id: Optional[str] = None, cursor: Optional[int] = None):
     try:
-        logs = await db_service.get_logs(limit=limit, device_id=device_id)
-        return logs
+        return ORJSONResponse(await _get_logs_page(limit, device_id, cursor))
     except Exception as e:
         logger.error(f"Error getting logs: {e}")
         raise HTTPException(status_code=500, detail="Failed to get logs")
@@ -233,21 +313,134 @@ async def update_config(config: dict):
         logger.error(f"Error updating config: {e}")
         raise HTTPException(status_code=500, detail="Failed to update config")
 
+# Batch endpoint: serve several read requests in one round trip by calling
+# the service layer directly instead of looping back through HTTP
+BATCH_MAX_REQUESTS = 20
+
+async def _batch_status(params: dict):
+    return (await _get_cached_status())["value"].model_dump()
+
+async def _batch_devices(params: dict):
+    return [device.model_dump() for device in await device_service.get_all_devices()]
+
+async def _batch_device(params: dict, device_id: str):
+    device = await device_service.get_device(device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return device.model_dump()
+
+async def _batch_sensors_latest(params: dict, device_id: str):
+    readings = await device_service.get_latest_sensor_readings(device_id)
+    return [reading.model_dump() for reading in readings]
+
+async def _batch_logs(params: dict):
+    try:
+        query = LogsQuery.model_validate(params)
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Invalid logs parameters")
+    return await _get_logs_page(query.limit, query.device_id, query.cursor)
+
+async def _batch_config(params: dict):
+    return await device_service.get_system_config()
+
+_BATCH_ROUTES = (
+    (re.compile(r"^/api/status$"), _batch_status),
+    (re.compile(r"^/api/devices$"), _batch_devices),
+    (re.compile(r"^/api/devices/(?P<device_id>[^/]+)$"), _batch_device),
+    (re.compile(r"^/api/sensors/(?P<device_id>[^/]+)/latest$"), _batch_sensors_latest),
+    (re.compile(r"^/api/logs$"), _batch_logs),
+    (re.compile(r"^/api/config$"), _batch_config),
+)
+
+async def _run_batch_item(item: BatchRequestItem) -> dict:
+    """Dispatch one batched request to its handler and wrap the result"""
+    for pattern, handler in _BATCH_ROUTES:
+        match = pattern.match(item.path)
+        if match:
+            break
+    else:
+        return {"path": item.path, "status": 404, "body": {"detail": "Not Found"}}
+    
+    try:
+        body = await handler(item.params, **match.groupdict())
+        return {"path": item.path, "status": 200, "body": body}
+    except HTTPException as e:
+        return {"path": item.path, "status": e.status_code, "body": {"detail": e.detail}}
+    except Exception as e:
+        logger.error(f"Error handling batch request {item.path}: {e}")
+        return {"path": item.path, "status": 500, "body": {"detail": "Internal error"}}
+
+@app.post("/api/batch", response_model=None)
+async def batch(request: BatchRequest):
+    if len(request.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_MAX_REQUESTS} requests per batch"
+        )
+    responses = await asyncio.gather(*(_run_batch_item(item) for item in request.requests))
+    return ORJSONResponse({"responses": responses})
+
 # WebSocket endpoint for real-time updates
+async def _status_broadcaster():
+    """Send the system status to every WebSocket client once per interval"""
+    while True:
+        await asyncio.sleep(STATUS_BROADCAST_INTERVAL)
+        if not _ws_clients:
+            continue
+        
+        try:
+            payload = (await _get_cached_status())["payload"]
+        except Exception as e:
+            logger.error(f"Error getting system status for broadcast: {e}")
+            continue
+        
+        clients = list(_ws_clients)
+        results = await asyncio.gather(
+            *(client.send_text(payload) for client in clients),
+            return_exceptions=True
+        )
+        
+        # Drop clients whose connection has gone away
+        for client, result in zip(clients, results):
+            if isinstance(result, Exception):
+                _ws_clients.discard(client)
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket):
+async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    _ws_clients.add(websocket)
     try:
+        # Send the current status right away; later updates come from the broadcaster
+        status = await _get_cached_status()
+        await websocket.send_text(status["payload"])
+        
         while True:
-            # Send periodic updates
-            status = await get_system_status()
-            await websocket.send_json(status.dict())
-            await asyncio.sleep(5)  # Update every 5 seconds
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
-        await websocket.close()
+        _ws_clients.discard(websocket)
+
+def _worker_count() -> int:
+    """Number of Uvicorn worker processes to start"""
+    workers = config.get('server.workers') or 1
+    # Every worker would run its own scheduler, heartbeat monitor and caches,
+    # watering once per worker and marking devices offline from partial views
+    if workers > 1:
+        logger.warning("server.workers > 1 is not supported, running a single worker")
+    return 1
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host=config.get('server.host', '0.0.0.0'),
+        port=config.get('server.port', 8000),
+        workers=_worker_count(),
+        # libuv event loop and C HTTP parser; uvloop is not available on Windows
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        ws="websockets"
+    ) 
\ No newline at end of file
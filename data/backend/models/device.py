@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from datetime import datetime
+from pydantic import BaseModel, Field, TypeAdapter
+from datetime import datetime, timezone
 from typing import List, Optional, Dict, Any
 from enum import Enum
 
@@ -30,6 +30,15 @@ class SensorReading(BaseModel):
     unit: str
     timestamp: datetime
     device_id: str
+    
+    @classmethod
+    def list_from_payload(cls, device_id: str, readings: List[Dict[str, Any]]) -> List["SensorReading"]:
+        """Validate a device's raw readings in a single pydantic-core call"""
+        return _sensor_reading_list.validate_python(
+            [{**reading, "device_id": device_id} for reading in readings]
+        )
+
+_sensor_reading_list = TypeAdapter(List[SensorReading])
 
 class Device(BaseModel):
     id: str
@@ -52,17 +61,12 @@ class Device(BaseModel):
     
     # Device capabilities
     capabilities: List[str] = []
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 class DeviceCommand(BaseModel):
     device_id: str
     command: str
     parameters: Dict[str, Any] = {}
-    timestamp: datetime = datetime.now()
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
 class DeviceResponse(BaseModel):
     device_id: str
@@ -70,7 +74,7 @@ class DeviceResponse(BaseModel):
     success: bool
     message: str
     data: Optional[Dict[str, Any]] = None
-    timestamp: datetime = datetime.now()
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class DeviceRegistration(BaseModel):
     id: str
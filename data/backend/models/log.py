@@ -18,11 +18,6 @@ class LogEntry(BaseModel):
     device_id: Optional[str] = None
     component: Optional[str] = None
     details: Optional[Dict[str, Any]] = None
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 class LogQuery(BaseModel):
     limit: int = 100
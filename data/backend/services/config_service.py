@@ -5,10 +5,15 @@ from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# Marks keys that resolved to nothing, so misses are cached too
+_MISSING = object()
+
 class ConfigService:
     def __init__(self, config_path: str = "config.yaml"):
         self.config_path = config_path
         self.config: Dict[str, Any] = {}
+        self._cache: Dict[str, Any] = {}
+        self._communication_method_lower = ''
         self.load_config()
     
     def load_config(self):
@@ -25,6 +30,13 @@ class ConfigService:
         except Exception as e:
             logger.error(f"Error loading configuration: {e}")
             self.config = self._get_default_config()
+        
+        self._invalidate_cache()
+    
+    def _invalidate_cache(self):
+        """Drop resolved lookups after the configuration changes"""
+        self._cache.clear()
+        self._communication_method_lower = self.get_communication_method().lower()
     
     def save_config(self):
         """Save current configuration to YAML file"""
@@ -64,14 +76,22 @@ class ConfigService:
     
     def get(self, key: str, default: Any = None) -> Any:
         """Get configuration value by key (supports dot notation)"""
-        keys = key.split('.')
+        try:
+            value = self._cache[key]
+        except KeyError:
+            value = self._cache[key] = self._resolve(key)
+        
+        return default if value is _MISSING else value
+    
+    def _resolve(self, key: str) -> Any:
+        """Walk the configuration dict along a dotted key"""
         value = self.config
         
-        for k in keys:
+        for k in key.split('.'):
             if isinstance(value, dict) and k in value:
                 value = value[k]
             else:
-                return default
+                return _MISSING
         
         return value
     
@@ -86,6 +106,7 @@ class ConfigService:
             config = config[k]
         
         config[keys[-1]] = value
+        self._invalidate_cache()
     
     def get_communication_method(self) -> str:
         """Get the current communication method"""
@@ -109,11 +130,11 @@ class ConfigService:
     
     def is_mqtt_enabled(self) -> bool:
         """Check if MQTT communication is enabled"""
-        return self.get_communication_method().lower() == 'mqtt'
+        return self._communication_method_lower == 'mqtt'
     
     def is_serial_enabled(self) -> bool:
         """Check if serial communication is enabled"""
-        return self.get_communication_method().lower() == 'serial'
+        return self._communication_method_lower == 'serial'
 
 # Global configuration instance
 config = ConfigService() 
\ No newline at end of file
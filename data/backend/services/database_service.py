@@ -1,32 +1,186 @@
+import ast
 import sqlite3
+import time
 import aiosqlite
 import asyncio
+import orjson
+from aiosqlitepool import SQLiteConnectionPool
 import logging
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
 from models.device import Device, DeviceStatus, SensorReading, DeviceType, SensorType
 from models.log import LogEntry, LogLevel
 
 logger = logging.getLogger(__name__)
 
+# Applied to every pooled connection when it is opened. journal_mode is
+# persisted in the database file, so it is set once in _configure_database.
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+# TIMESTAMP columns come back from the driver as datetime objects. Parsing
+# with the C fromisoformat also accepts the 'T' separator and UTC offsets,
+# which the stdlib default converter rejects.
+DETECT_TYPES = sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+# Columns read back by the row converters, which look values up by name
+DEVICE_COLUMNS = (
+    "id", "name", "device_type", "status", "ip_address", "last_seen", "location",
+    "description", "firmware_version", "battery_level", "is_active", "config", "capabilities",
+)
+SENSOR_READING_COLUMNS = ("device_id", "sensor_type", "value", "unit", "timestamp")
+LOG_COLUMNS = ("id", "level", "message", "timestamp", "device_id", "component", "details")
+
+DEVICE_SELECT = ", ".join(DEVICE_COLUMNS)
+SENSOR_READING_SELECT = ", ".join(SENSOR_READING_COLUMNS)
+LOG_SELECT = ", ".join(LOG_COLUMNS)
+
+# Log and sensor inserts are coalesced into batches of at most
+# BATCH_MAX_SIZE rows, flushed no later than BATCH_MAX_DELAY seconds
+BATCH_MAX_SIZE = 100
+BATCH_MAX_DELAY = 0.05
+# Queued log entries / sensor readings beyond these make add_log and
+# add_sensor_reading wait for the flusher
+LOG_QUEUE_MAX_SIZE = 10000
+READING_QUEUE_MAX_SIZE = 10000
+
+# Statements for the write paths. Keeping the text stable lets sqlite3's
+# per-connection statement cache reuse the compiled statements.
+SQL_INSERT_DEVICE = '''
+    INSERT OR REPLACE INTO devices 
+    (id, name, device_type, status, ip_address, last_seen, location, 
+     description, firmware_version, battery_level, is_active, config, capabilities, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_UPDATE_DEVICE_STATUS = '''
+    UPDATE devices 
+    SET status = ?, last_seen = ?, updated_at = ?
+    WHERE id = ?
+'''
+SQL_INSERT_SENSOR_READING = '''
+    INSERT INTO sensor_readings 
+    (device_id, sensor_type, value, unit, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+'''
+SQL_INSERT_LOG = '''
+    INSERT INTO system_logs 
+    (level, message, timestamp, device_id, component, details)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+SQL_SET_CONFIG = '''
+    INSERT OR REPLACE INTO system_config (key, value, updated_at)
+    VALUES (?, ?, ?)
+'''
+
+# Only readings newer than this count as a device's latest readings
+LATEST_READING_WINDOW = timedelta(hours=1)
+
+# Seconds before a device's cached latest readings are re-read from the
+# database, picking up rows written by other processes
+LATEST_READING_CACHE_TTL = 30.0
+
+# Upper bound on rows returned by a single get_logs page
+LOGS_MAX_LIMIT = 1000
+
+# Upper bound on rows returned by get_sensor_history
+SENSOR_HISTORY_LIMIT = 10000
+
+# Stored in PRAGMA user_version; bump when adding a data migration
+SCHEMA_VERSION = 1
+
+def _to_json(value: Any) -> Optional[str]:
+    """Encode a JSON column value, keeping NULL for None"""
+    if value is None:
+        return None
+    return orjson.dumps(value, default=str).decode()
+
+def _from_json(value: Optional[str]) -> Any:
+    """Decode a JSON column value"""
+    return orjson.loads(value) if value else None
+
+def _local_naive(timestamp: datetime) -> datetime:
+    """Express a timestamp as naive local time, the format stored in the database"""
+    return timestamp.astimezone().replace(tzinfo=None) if timestamp.tzinfo else timestamp
+
+def _latest_reading_cutoff() -> datetime:
+    """Start of the latest-readings window, as an aware UTC datetime"""
+    return datetime.now(timezone.utc) - LATEST_READING_WINDOW
+
+async def _enqueue(queue: asyncio.Queue, item: Any):
+    """Put item on queue without suspending unless the queue is full"""
+    try:
+        queue.put_nowait(item)
+    except asyncio.QueueFull:
+        logger.warning("Write queue full, waiting for the batch writer")
+        await queue.put(item)
+
 class DatabaseService:
-    def __init__(self, db_path: str = "data/iot_system.db"):
+    def __init__(self, db_path: str = "data/iot_system.db", pool_size: int = 8):
         self.db_path = db_path
-        self.connection = None
+        self.pool_size = pool_size
+        self.pool: Optional[SQLiteConnectionPool] = None
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock = asyncio.Lock()
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=LOG_QUEUE_MAX_SIZE)
+        self._reading_queue: asyncio.Queue = asyncio.Queue(maxsize=READING_QUEUE_MAX_SIZE)
+        self._flush_tasks: List[asyncio.Task] = []
+        # Latest reading per device and sensor type, kept current by the
+        # batched writer; devices are served from it once loaded from the DB
+        self._latest: Dict[str, Dict[SensorType, SensorReading]] = {}
+        # Monotonic time each device's cache entry was last read from the DB
+        self._latest_loaded: Dict[str, float] = {}
         
     async def initialize(self):
         """Initialize database and create tables"""
         try:
+            # SQLite allows a single writer, so all writes share one connection;
+            # reads go through a pool of read-only connections that keep
+            # SQLite's page cache warm between requests
+            self._writer = await self._connect()
+            self.pool = SQLiteConnectionPool(
+                lambda: self._connect(read_only=True), pool_size=self.pool_size
+            )
+            
+            # Switch to WAL before any tables are touched
+            await self._configure_database()
+            
             # Create tables
             await self._create_tables()
+            await self._migrate_json_columns()
+            
+            # Start background writers for batched inserts
+            self._flush_tasks = [
+                asyncio.create_task(self._flush_loop(self._log_queue, self._write_logs)),
+                asyncio.create_task(self._flush_loop(self._reading_queue, self._write_sensor_readings)),
+            ]
             logger.info("Database initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
     
+    async def _configure_database(self):
+        """Enable WAL journaling so readers don't block the writer"""
+        async with self._write_connection() as db:
+            cursor = await db.execute("PRAGMA journal_mode=WAL")
+            row = await cursor.fetchone()
+            
+            if row and row[0] != "wal":
+                logger.warning(f"Could not enable WAL mode, journal_mode is {row[0]}")
+    
     async def _create_tables(self):
         """Create all required tables"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write_connection() as db:
+            # Take the write lock up front: with several workers starting at
+            # once, a deferred BEGIN could fail to upgrade and hit SQLITE_BUSY
+            await db.execute("BEGIN IMMEDIATE")
+            
             # Devices table
             await db.execute('''
                 CREATE TABLE IF NOT EXISTS devices (
@@ -101,39 +255,165 @@ class DatabaseService:
             # Create indexes for better performance
             await db.execute('CREATE INDEX IF NOT EXISTS idx_sensor_readings_device_timestamp ON sensor_readings(device_id, timestamp)')
             await db.execute('CREATE INDEX IF NOT EXISTS idx_system_logs_timestamp ON system_logs(timestamp)')
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_system_logs_device_timestamp ON system_logs(device_id, timestamp DESC)')
+            # Index entries carry the rowid, so this also serves per-device keyset pagination by id
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_system_logs_device_id ON system_logs(device_id)')
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_sensor_readings_device_type_timestamp ON sensor_readings(device_id, sensor_type, timestamp DESC)')
             await db.execute('CREATE INDEX IF NOT EXISTS idx_device_commands_device_timestamp ON device_commands(device_id, timestamp)')
             
-            await db.commit()
+            await db.execute("COMMIT")
             logger.info("Database tables created successfully")
     
+    async def _migrate_json_columns(self):
+        """Rewrite columns stored as Python literals (str(dict)) as JSON"""
+        async with self._write_connection() as db:
+            # Check the version under the write lock so only one worker migrates
+            await db.execute("BEGIN IMMEDIATE")
+            cursor = await db.execute("PRAGMA user_version")
+            row = await cursor.fetchone()
+            if row[0] >= SCHEMA_VERSION:
+                await db.execute("COMMIT")
+                return
+            
+            for table, columns in (("devices", ("config", "capabilities")), ("system_logs", ("details",))):
+                cursor = await db.execute(f"SELECT rowid, {', '.join(columns)} FROM {table}")
+                updates = [
+                    (*(self._literal_to_json(value) for value in row[1:]), row[0])
+                    for row in await cursor.fetchall()
+                ]
+                if updates:
+                    assignments = ", ".join(f"{column} = ?" for column in columns)
+                    await db.executemany(f"UPDATE {table} SET {assignments} WHERE rowid = ?", updates)
+                logger.info(f"Migrated {len(updates)} {table} rows to JSON columns")
+            
+            await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            await db.execute("COMMIT")
+    
+    @staticmethod
+    def _literal_to_json(value: Optional[str]) -> Optional[str]:
+        """Convert a legacy Python literal string to JSON text"""
+        if value is None:
+            return None
+        try:
+            orjson.loads(value)
+            return value
+        except orjson.JSONDecodeError:
+            pass
+        try:
+            return _to_json(ast.literal_eval(value))
+        except (ValueError, SyntaxError):
+            logger.warning(f"Dropping unparseable legacy value: {value!r}")
+            return None
+    
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        """Open a new connection with the tuned PRAGMAs applied"""
+        # Autocommit mode; multi-statement writes use explicit BEGIN/COMMIT
+        if read_only:
+            uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+            db = await aiosqlite.connect(uri, uri=True, isolation_level=None,
+                                         detect_types=DETECT_TYPES)
+        else:
+            db = await aiosqlite.connect(self.db_path, isolation_level=None,
+                                         detect_types=DETECT_TYPES)
+        db.row_factory = aiosqlite.Row
+        for pragma in CONNECTION_PRAGMAS:
+            await db.execute(pragma)
+        return db
+    
+    @asynccontextmanager
+    async def _write_connection(self):
+        """Hold the writer connection exclusively for one unit of work"""
+        async with self._writer_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                if self._writer.in_transaction:
+                    await self._writer.rollback()
+                raise
+    
+    async def _flush_loop(self, queue: asyncio.Queue, writer):
+        """Drain queue in bounded batches and hand each batch to writer"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + BATCH_MAX_DELAY
+            
+            while len(batch) < BATCH_MAX_SIZE:
+                # Take whatever is already queued before waiting on the clock
+                try:
+                    batch.append(queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                await writer(batch)
+            except Exception as e:
+                logger.error(f"Error writing batch of {len(batch)} rows: {e}")
+            finally:
+                for _ in batch:
+                    queue.task_done()
+    
+    async def flush(self):
+        """Wait until all queued log entries and sensor readings are written"""
+        if self._flush_tasks:
+            await self._log_queue.join()
+            await self._reading_queue.join()
+    
     async def close(self):
-        """Close database connection"""
-        if self.connection:
-            await self.connection.close()
-            logger.info("Database connection closed")
+        """Close the writer connection and the reader pool"""
+        await self.flush()
+        for task in self._flush_tasks:
+            task.cancel()
+        await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        self._flush_tasks = []
+        
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+        if self._writer:
+            await self._writer.close()
+            self._writer = None
+        logger.info("Database connections closed")
     
     # Device operations
+    def _device_row(self, device: Device, updated_at: datetime) -> tuple:
+        """Build the SQL_INSERT_DEVICE parameters for a device"""
+        return (
+            device.id, device.name, device.device_type, device.status,
+            device.ip_address, device.last_seen, device.location,
+            device.description, device.firmware_version, device.battery_level,
+            device.is_active, _to_json(device.config), _to_json(device.capabilities),
+            updated_at
+        )
+    
     async def add_device(self, device: Device):
         """Add or update device in database"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                INSERT OR REPLACE INTO devices 
-                (id, name, device_type, status, ip_address, last_seen, location, 
-                 description, firmware_version, battery_level, is_active, config, capabilities, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                device.id, device.name, device.device_type, device.status,
-                device.ip_address, device.last_seen, device.location,
-                device.description, device.firmware_version, device.battery_level,
-                device.is_active, str(device.config), str(device.capabilities),
-                datetime.now()
-            ))
-            await db.commit()
+        async with self._write_connection() as db:
+            await db.execute(SQL_INSERT_DEVICE, self._device_row(device, datetime.now()))
+    
+    async def add_devices_bulk(self, devices: List[Device]):
+        """Add or update several devices in a single transaction"""
+        now = datetime.now()
+        rows = [self._device_row(device, now) for device in devices]
+        
+        async with self._write_connection() as db:
+            await db.execute("BEGIN")
+            await db.executemany(SQL_INSERT_DEVICE, rows)
+            await db.execute("COMMIT")
     
     async def get_device(self, device_id: str) -> Optional[Device]:
         """Get device by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('SELECT * FROM devices WHERE id = ?', (device_id,))
+        async with self.pool.connection() as db:
+            cursor = await db.execute(f'SELECT {DEVICE_SELECT} FROM devices WHERE id = ?', (device_id,))
             row = await cursor.fetchone()
             
             if row:
@@ -141,103 +421,188 @@ class DatabaseService:
             return None
     
     async def get_all_devices(self) -> List[Device]:
-        """Get all devices"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('SELECT * FROM devices WHERE is_active = 1')
+        """Get all devices with their latest sensor readings in a single query"""
+        async with self.pool.connection() as db:
+            # Rank each device's readings per sensor type and keep the newest one
+            cursor = await db.execute(f'''
+                SELECT {", ".join(f"d.{column}" for column in DEVICE_COLUMNS)},
+                       s.device_id, s.sensor_type, s.value, s.unit, s.timestamp
+                FROM devices d
+                LEFT JOIN (
+                    SELECT {SENSOR_READING_SELECT}, ROW_NUMBER() OVER (
+                        PARTITION BY device_id, sensor_type ORDER BY timestamp DESC
+                    ) AS rn
+                    FROM sensor_readings
+                    WHERE timestamp > ?
+                ) s ON s.device_id = d.id AND s.rn = 1
+                WHERE d.is_active = 1
+                ORDER BY d.rowid, s.sensor_type
+            ''', (_local_naive(_latest_reading_cutoff()),))
             rows = await cursor.fetchall()
             
-            devices = []
+            # Bucket the joined rows by device in one pass
+            devices: Dict[str, Device] = {}
             for row in rows:
-                device = self._row_to_device(row)
-                # Get latest sensor readings for this device
-                device.latest_readings = await self.get_latest_sensor_readings(device.id)
-                devices.append(device)
+                device = devices.get(row["id"])
+                if device is None:
+                    device = devices[row["id"]] = self._row_to_device(row)
+                if row["sensor_type"] is not None:
+                    device.latest_readings.append(self._row_to_sensor_reading(row))
             
-            return devices
+            return list(devices.values())
     
     async def update_device_status(self, device_id: str, status: DeviceStatus):
         """Update device status"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                UPDATE devices 
-                SET status = ?, last_seen = ?, updated_at = ?
-                WHERE id = ?
-            ''', (status, datetime.now(), datetime.now(), device_id))
-            await db.commit()
+        now = datetime.now()
+        async with self._write_connection() as db:
+            await db.execute(SQL_UPDATE_DEVICE_STATUS, (status, now, now, device_id))
+    
+    async def update_device_statuses_bulk(self, updates: List[Tuple[str, DeviceStatus]]):
+        """Update the status of several devices in a single transaction"""
+        now = datetime.now()
+        rows = [(status, now, now, device_id) for device_id, status in updates]
+        
+        async with self._write_connection() as db:
+            await db.execute("BEGIN")
+            await db.executemany(SQL_UPDATE_DEVICE_STATUS, rows)
+            await db.execute("COMMIT")
     
     # Sensor readings operations
     async def add_sensor_reading(self, reading: SensorReading):
-        """Add sensor reading to database"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                INSERT INTO sensor_readings 
-                (device_id, sensor_type, value, unit, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                reading.device_id, reading.sensor_type, reading.value,
-                reading.unit, reading.timestamp
-            ))
-            await db.commit()
+        """Queue sensor reading for the next batched insert"""
+        await _enqueue(self._reading_queue, reading)
+    
+    async def add_sensor_readings_bulk(self, readings: List[SensorReading]):
+        """Queue several sensor readings so they are written in the same batch"""
+        for reading in readings:
+            await _enqueue(self._reading_queue, reading)
+    
+    async def _write_sensor_readings(self, readings: List[SensorReading]):
+        """Insert a batch of sensor readings in a single transaction"""
+        rows = [(
+            reading.device_id, reading.sensor_type, reading.value,
+            reading.unit, reading.timestamp
+        ) for reading in readings]
+        
+        async with self._write_connection() as db:
+            await db.execute("BEGIN")
+            await db.executemany(SQL_INSERT_SENSOR_READING, rows)
+            await db.execute("COMMIT")
+        
+        for reading in readings:
+            self._cache_latest_reading(reading)
+    
+    def _cache_latest_reading(self, reading: SensorReading):
+        """Store reading as its sensor's latest unless a newer one is cached"""
+        cached = self._latest.setdefault(reading.device_id, {})
+        current = cached.get(reading.sensor_type)
+        # Naive timestamps are local time; astimezone makes both sides comparable
+        if (current is None or reading.timestamp.astimezone(timezone.utc)
+                > current.timestamp.astimezone(timezone.utc)):
+            cached[reading.sensor_type] = reading
     
     async def get_latest_sensor_readings(self, device_id: str) -> List[SensorReading]:
         """Get latest sensor readings for a device"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('''
-                SELECT * FROM sensor_readings 
+        loaded = self._latest_loaded.get(device_id)
+        if loaded is None or time.monotonic() - loaded >= LATEST_READING_CACHE_TTL:
+            await self._load_latest_sensor_readings(device_id)
+        
+        since = _latest_reading_cutoff()
+        readings = self._latest.get(device_id, {})
+        return [
+            readings[sensor_type] for sensor_type in sorted(readings)
+            if readings[sensor_type].timestamp.astimezone(timezone.utc) > since
+        ]
+    
+    async def _load_latest_sensor_readings(self, device_id: str):
+        """Refresh the latest-reading cache for a device from the database"""
+        since = _local_naive(_latest_reading_cutoff())
+        loaded = time.monotonic()
+        async with self.pool.connection() as db:
+            cursor = await db.execute(f'''
+                SELECT {SENSOR_READING_SELECT} FROM sensor_readings 
                 WHERE device_id = ? 
-                AND timestamp > datetime('now', '-1 hour')
+                AND timestamp > ?
                 ORDER BY sensor_type, timestamp DESC
-            ''', (device_id,))
+            ''', (device_id, since))
             rows = await cursor.fetchall()
             
             # Get the latest reading for each sensor type
             readings_by_type = {}
             for row in rows:
-                sensor_type = row[2]
+                sensor_type = row["sensor_type"]
                 if sensor_type not in readings_by_type:
                     readings_by_type[sensor_type] = self._row_to_sensor_reading(row)
-            
-            return list(readings_by_type.values())
+        
+        # Merge rather than replace so readings written while the query ran win
+        for reading in readings_by_type.values():
+            self._cache_latest_reading(reading)
+        self._latest_loaded[device_id] = loaded
     
-    async def get_sensor_history(self, device_id: str, hours: int = 24) -> List[SensorReading]:
-        """Get sensor readings history"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('''
-                SELECT * FROM sensor_readings 
+    async def get_sensor_history(self, device_id: str, hours: int = 24,
+                                 limit: int = SENSOR_HISTORY_LIMIT) -> AsyncIterator[Dict[str, Any]]:
+        """Stream sensor readings history as plain dicts, newest first"""
+        # Bound as a datetime so it is stored/compared in the same format as
+        # the timestamps written by add_sensor_reading
+        since = datetime.now() - timedelta(hours=hours)
+        
+        # Fetch the capped rows up front so the pooled connection is returned
+        # before the caller streams them to a possibly slow client
+        async with self.pool.connection() as db:
+            cursor = await db.execute(f'''
+                SELECT {SENSOR_READING_SELECT} FROM sensor_readings 
                 WHERE device_id = ? 
-                AND timestamp > datetime('now', '-{} hours')
+                AND timestamp > ?
                 ORDER BY timestamp DESC
-            '''.format(hours), (device_id,))
+                LIMIT ?
+            ''', (device_id, since, limit))
             rows = await cursor.fetchall()
-            
-            return [self._row_to_sensor_reading(row) for row in rows]
+        
+        # Dicts are still built lazily, one per streamed item
+        for row in rows:
+            yield self._row_to_sensor_dict(row)
     
     # Logging operations
     async def add_log(self, log_entry: LogEntry):
-        """Add log entry to database"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                INSERT INTO system_logs 
-                (level, message, timestamp, device_id, component, details)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                log_entry.level, log_entry.message, log_entry.timestamp,
-                log_entry.device_id, log_entry.component, str(log_entry.details)
-            ))
-            await db.commit()
-    
-    async def get_logs(self, limit: int = 100, device_id: Optional[str] = None) -> List[LogEntry]:
-        """Get system logs"""
-        async with aiosqlite.connect(self.db_path) as db:
-            query = 'SELECT * FROM system_logs'
+        """Queue log entry for the next batched insert"""
+        await _enqueue(self._log_queue, log_entry)
+    
+    async def add_logs_bulk(self, log_entries: List[LogEntry]):
+        """Queue several log entries so they are written in the same batch"""
+        for log_entry in log_entries:
+            await _enqueue(self._log_queue, log_entry)
+    
+    async def _write_logs(self, log_entries: List[LogEntry]):
+        """Insert a batch of log entries in a single transaction"""
+        rows = [(
+            log_entry.level, log_entry.message, log_entry.timestamp,
+            log_entry.device_id, log_entry.component, _to_json(log_entry.details)
+        ) for log_entry in log_entries]
+        
+        async with self._write_connection() as db:
+            await db.execute("BEGIN")
+            await db.executemany(SQL_INSERT_LOG, rows)
+            await db.execute("COMMIT")
+    
+    async def get_logs(self, limit: int = 100, device_id: Optional[str] = None,
+                       cursor: Optional[int] = None) -> List[LogEntry]:
+        """Get system logs newest first, starting below the cursor id if given"""
+        async with self.pool.connection() as db:
+            query = f'SELECT {LOG_SELECT} FROM system_logs'
+            conditions = []
             params = []
             
             if device_id:
-                query += ' WHERE device_id = ?'
+                conditions.append('device_id = ?')
                 params.append(device_id)
+            if cursor is not None:
+                conditions.append('id < ?')
+                params.append(cursor)
+            if conditions:
+                query += ' WHERE ' + ' AND '.join(conditions)
             
-            query += ' ORDER BY timestamp DESC LIMIT ?'
-            params.append(limit)
+            query += ' ORDER BY id DESC LIMIT ?'
+            params.append(max(0, min(limit, LOGS_MAX_LIMIT)))
             
             cursor = await db.execute(query, params)
             rows = await cursor.fetchall()
@@ -247,64 +612,70 @@ class DatabaseService:
     # Configuration operations
     async def get_config(self, key: str) -> Optional[str]:
         """Get configuration value"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.connection() as db:
             cursor = await db.execute('SELECT value FROM system_config WHERE key = ?', (key,))
             row = await cursor.fetchone()
-            return row[0] if row else None
+            return row["value"] if row else None
     
     async def set_config(self, key: str, value: str):
         """Set configuration value"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                INSERT OR REPLACE INTO system_config (key, value, updated_at)
-                VALUES (?, ?, ?)
-            ''', (key, value, datetime.now()))
-            await db.commit()
+        async with self._write_connection() as db:
+            await db.execute(SQL_SET_CONFIG, (key, value, datetime.now()))
     
     async def get_all_config(self) -> Dict[str, str]:
         """Get all configuration values"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.connection() as db:
             cursor = await db.execute('SELECT key, value FROM system_config')
             rows = await cursor.fetchall()
-            return {row[0]: row[1] for row in rows}
+            return {row["key"]: row["value"] for row in rows}
     
     # Helper methods
     def _row_to_device(self, row) -> Device:
         """Convert database row to Device object"""
         return Device(
-            id=row[0],
-            name=row[1],
-            device_type=DeviceType(row[2]),
-            status=DeviceStatus(row[3]),
-            ip_address=row[4],
-            last_seen=datetime.fromisoformat(row[5]) if row[5] else None,
-            location=row[6],
-            description=row[7],
-            firmware_version=row[8],
-            battery_level=row[9],
-            is_active=bool(row[10]),
-            config=eval(row[11]) if row[11] else {},
-            capabilities=eval(row[12]) if row[12] else []
+            id=row["id"],
+            name=row["name"],
+            device_type=DeviceType(row["device_type"]),
+            status=DeviceStatus(row["status"]),
+            ip_address=row["ip_address"],
+            last_seen=row["last_seen"],
+            location=row["location"],
+            description=row["description"],
+            firmware_version=row["firmware_version"],
+            battery_level=row["battery_level"],
+            is_active=bool(row["is_active"]),
+            config=_from_json(row["config"]) or {},
+            capabilities=_from_json(row["capabilities"]) or []
         )
     
     def _row_to_sensor_reading(self, row) -> SensorReading:
         """Convert database row to SensorReading object"""
         return SensorReading(
-            device_id=row[1],
-            sensor_type=SensorType(row[2]),
-            value=row[3],
-            unit=row[4],
-            timestamp=datetime.fromisoformat(row[5])
+            device_id=row["device_id"],
+            sensor_type=SensorType(row["sensor_type"]),
+            value=row["value"],
+            unit=row["unit"],
+            timestamp=row["timestamp"]
         )
     
+    def _row_to_sensor_dict(self, row) -> Dict[str, Any]:
+        """Convert database row to a SensorReading-shaped dict, skipping validation"""
+        return {
+            "sensor_type": row["sensor_type"],
+            "value": row["value"],
+            "unit": row["unit"],
+            "timestamp": row["timestamp"],
+            "device_id": row["device_id"]
+        }
+    
     def _row_to_log_entry(self, row) -> LogEntry:
         """Convert database row to LogEntry object"""
         return LogEntry(
-            id=row[0],
-            level=LogLevel(row[1]),
-            message=row[2],
-            timestamp=datetime.fromisoformat(row[3]),
-            device_id=row[4],
-            component=row[5],
-            details=eval(row[6]) if row[6] else None
+            id=row["id"],
+            level=LogLevel(row["level"]),
+            message=row["message"],
+            timestamp=row["timestamp"],
+            device_id=row["device_id"],
+            component=row["component"],
+            details=_from_json(row["details"])
         ) 
\ No newline at end of file
@@ -1,9 +1,12 @@
 import asyncio
 import json
 import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
-from models.device import Device, DeviceStatus, SensorReading, DeviceType, SensorType
+from typing import List, Optional, Dict, Any, AsyncIterator, Awaitable, Callable, Hashable, Tuple, Set
+from models.device import Device, DeviceStatus, SensorReading, DeviceType
 from models.log import LogEntry, LogLevel
 from services.database_service import DatabaseService
 from services.mqtt_service import MQTTService
@@ -13,12 +16,88 @@ from typing import Union
 
 logger = logging.getLogger(__name__)
 
+# New status for a device and the log entry recording the change
+StatusChange = Tuple[DeviceStatus, LogEntry]
+
+# System configuration values written on first start if not already set
+DEFAULT_SYSTEM_CONFIG = {
+    "watering_schedule": "daily",
+    "watering_time": "06:00",
+    "default_water_duration": "5",
+    "max_water_duration": "60",
+    "temperature_threshold": "25",
+    "humidity_threshold": "60",
+    "soil_moisture_threshold": "30"
+}
+
+# Devices registered when the communication service has no device configs
+_DEFAULT_DEVICE_CONFIGS = (
+    {
+        'id': 'arduino_pump',
+        'name': 'Arduino Water Pump',
+        'device_type': 'pump',
+        'location': 'Balcony',
+        'description': 'Main watering pump for balcony plants',
+        'capabilities': ['water_control', 'status_reporting'],
+        'config': {
+            'max_water_duration': 60,
+            'default_water_duration': 5
+        }
+    },
+    {
+        'id': 'arduino_sensors',
+        'name': 'Arduino Sensor Array',
+        'device_type': 'sensor',
+        'location': 'Balcony',
+        'description': 'Temperature, humidity, and soil moisture sensors',
+        'capabilities': ['temperature_reading', 'humidity_reading', 'soil_moisture_reading'],
+        'config': {
+            'reading_interval': 30
+        }
+    },
+)
+
+# Enum members by value, for parsing incoming messages without Enum.__call__
+_STATUS_BY_VALUE = {status.value: status for status in DeviceStatus}
+_TYPE_BY_VALUE = {device_type.value: device_type for device_type in DeviceType}
+
+# Most recently used devices kept by get_device
+DEVICE_CACHE_SIZE = 256
+
+# Seconds without a status update before an online device is marked offline
+HEARTBEAT_TIMEOUT = 300
+
+# How long get_system_config serves its cached copy before re-reading
+CONFIG_CACHE_TTL = 30.0
+
 class DeviceService:
     def __init__(self, db_service: DatabaseService, communication_service: Union[MQTTService, SerialService, MixedCommunicationService]):
         self.db_service = db_service
         self.communication_service = communication_service
-        self.device_heartbeat_tasks = {}
+        # Pending heartbeat timeouts for online devices, by device id
+        self.device_heartbeat_tasks: Dict[str, asyncio.TimerHandle] = {}
         self.default_devices = []
+        # Bind the communication-service specific strategies once
+        if isinstance(communication_service, MixedCommunicationService):
+            self._status_probe = self._status_probe_mixed
+            self._get_device_configs = self._get_device_configs_mixed
+        else:
+            self._status_probe = self._status_probe_simple
+            self._get_device_configs = self._get_device_configs_simple
+        # Set whenever the system config changes so schedules can be recomputed
+        self._config_changed = asyncio.Event()
+        self._config_cache: Optional[Dict[str, Any]] = None
+        self._config_cache_ts = 0.0
+        self._config_version = 0
+        # Reads currently running, shared by concurrent callers with the same key
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # LRU of get_device results, dropped whenever a device row is written
+        self._device_cache: "OrderedDict[str, Device]" = OrderedDict()
+        # Active devices as last written by this service, walked by the monitor
+        self._devices_snapshot: Dict[str, Device] = {}
+        # Background loops, owned by the task group opened in running()
+        self._task_group: Optional[asyncio.TaskGroup] = None
+        self._background_tasks: Set[asyncio.Task] = set()
         
     async def initialize(self):
         """Initialize device service"""
@@ -40,11 +119,8 @@ class DeviceService:
             # Initialize default devices
             await self._initialize_default_devices()
             
-            # Start device monitoring
-            asyncio.create_task(self._monitor_devices())
-            
-            # Check device status immediately on startup
-            asyncio.create_task(self._initial_device_status_check())
+            # Store default configuration values that are not set yet
+            await self._initialize_default_config()
             
             logger.info("Device service initialized successfully")
             
@@ -52,44 +128,53 @@ class DeviceService:
             logger.error(f"Error initializing device service: {e}")
             raise
     
+    @asynccontextmanager
+    async def running(self):
+        """Run the background loops for as long as the context is open"""
+        async with asyncio.TaskGroup() as task_group:
+            self._task_group = task_group
+            try:
+                # Start device monitoring
+                self._start_background_task(self._monitor_devices())
+                
+                # Check device status immediately on startup
+                self._start_background_task(self._initial_device_status_check())
+                
+                yield self
+            finally:
+                # Leaving the group waits for every task, so stop them first
+                self._task_group = None
+                for timer in self.device_heartbeat_tasks.values():
+                    timer.cancel()
+                self.device_heartbeat_tasks.clear()
+                for task in self._background_tasks:
+                    task.cancel()
+    
+    def _start_background_task(self, coro):
+        """Run coro in the service's task group so shutdown cancels it"""
+        if self._task_group is None:
+            coro.close()
+            raise RuntimeError("Device service background tasks are not running")
+        task = self._task_group.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    def _get_device_configs_mixed(self) -> List[Dict[str, Any]]:
+        """Device configurations declared to the mixed communication service"""
+        return list(self.communication_service.get_device_configs().values())
+    
+    def _get_device_configs_simple(self) -> List[Dict[str, Any]]:
+        """Fallback device configurations for older single-mode services"""
+        return list(_DEFAULT_DEVICE_CONFIGS)
+    
     async def _initialize_default_devices(self):
         """Initialize devices from configuration"""
         # Get device configurations from communication service
-        device_configs = []
-        
-        if isinstance(self.communication_service, MixedCommunicationService):
-            device_configs = list(self.communication_service.get_device_configs().values())
-        else:
-            # Fallback for older single-mode services
-            device_configs = [
-                {
-                    'id': 'arduino_pump',
-                    'name': 'Arduino Water Pump',
-                    'device_type': 'pump',
-                    'location': 'Balcony',
-                    'description': 'Main watering pump for balcony plants',
-                    'capabilities': ['water_control', 'status_reporting'],
-                    'config': {
-                        'max_water_duration': 60,
-                        'default_water_duration': 5
-                    }
-                },
-                {
-                    'id': 'arduino_sensors',
-                    'name': 'Arduino Sensor Array',
-                    'device_type': 'sensor',
-                    'location': 'Balcony',
-                    'description': 'Temperature, humidity, and soil moisture sensors',
-                    'capabilities': ['temperature_reading', 'humidity_reading', 'soil_moisture_reading'],
-                    'config': {
-                        'reading_interval': 30
-                    }
-                }
-            ]
+        device_configs = self._get_device_configs()
         
         # Convert configurations to Device objects
-        for device_config in device_configs:
-            device = Device(
+        devices = [
+            Device(
                 id=device_config.get('id', 'unknown'),
                 name=device_config.get('name', 'Unknown Device'),
                 device_type=DeviceType(device_config.get('device_type', 'sensor')),
@@ -99,24 +184,98 @@ class DeviceService:
                 capabilities=device_config.get('capabilities', []),
                 config=device_config.get('config', {})
             )
-            
-            # Add device to database
-            await self.db_service.add_device(device)
-            self.default_devices.append(device)
+            for device_config in device_configs
+        ]
+        
+        # Add devices to database
+        await self.db_service.add_devices_bulk(devices)
+        for device in devices:
+            self._device_cache.pop(device.id, None)
+        self.default_devices.extend(devices)
+        for device in devices:
+            self._devices_snapshot[device.id] = device.model_copy()
         
         logger.info(f"Initialized {len(device_configs)} devices from configuration")
     
+    async def _coalesce(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fetch once for all concurrent callers using the same key"""
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fetch())
+            self._inflight[key] = future
+            future.add_done_callback(
+                lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None
+            )
+        # Shielded so one cancelled caller does not cancel the others' result
+        return await asyncio.shield(future)
+    
     async def get_all_devices(self) -> List[Device]:
         """Get all devices from database"""
-        return await self.db_service.get_all_devices()
+        return await self._coalesce("devices", self.db_service.get_all_devices)
     
     async def get_device(self, device_id: str) -> Optional[Device]:
         """Get specific device by ID"""
-        return await self.db_service.get_device(device_id)
+        device = self._device_cache.get(device_id)
+        if device is not None:
+            self._device_cache.move_to_end(device_id)
+            return device
+        
+        device = await self.db_service.get_device(device_id)
+        if device is not None:
+            self._device_cache[device_id] = device
+            if len(self._device_cache) > DEVICE_CACHE_SIZE:
+                self._device_cache.popitem(last=False)
+        return device
+    
+    async def _update_device_status(self, device_id: str, status: DeviceStatus):
+        """Write a device status and drop the stale cached device"""
+        await self.db_service.update_device_status(device_id, status)
+        self._status_written(device_id, status)
+    
+    def _status_written(self, device_id: str, status: DeviceStatus, delay: float = HEARTBEAT_TIMEOUT):
+        """Drop the cached device and restart its heartbeat timeout"""
+        self._device_cache.pop(device_id, None)
+        
+        snapshot = self._devices_snapshot.get(device_id)
+        if snapshot is not None:
+            snapshot.status = status
+        
+        timer = self.device_heartbeat_tasks.pop(device_id, None)
+        if timer:
+            timer.cancel()
+        # Status writes refresh last_seen, so an online device now has delay
+        # seconds until it is considered gone
+        if status == DeviceStatus.ONLINE and self._task_group is not None:
+            self.device_heartbeat_tasks[device_id] = asyncio.get_running_loop().call_later(
+                delay, self._on_heartbeat_timeout, device_id
+            )
+    
+    def _on_heartbeat_timeout(self, device_id: str):
+        """Timer callback for a device whose heartbeat has lapsed"""
+        self.device_heartbeat_tasks.pop(device_id, None)
+        if self._task_group is not None:
+            self._start_background_task(self._mark_offline(device_id))
+    
+    async def _mark_offline(self, device_id: str):
+        """Mark a device offline after its heartbeat timeout"""
+        try:
+            await self._update_device_status(device_id, DeviceStatus.OFFLINE)
+            await self.db_service.add_log(LogEntry(
+                level=LogLevel.WARNING,
+                message=f"Device went offline (no heartbeat)",
+                device_id=device_id,
+                component="device_service",
+                timestamp=datetime.now()
+            ))
+            logger.info(f"Device {device_id} status updated: {DeviceStatus.OFFLINE.value}")
+        except Exception as e:
+            logger.error(f"Error marking device {device_id} offline: {e}")
     
     async def register_device(self, device: Device):
         """Register a new device"""
         await self.db_service.add_device(device)
+        self._devices_snapshot[device.id] = device.model_copy()
+        self._status_written(device.id, device.status)
         
         # Log device registration
         await self.db_service.add_log(LogEntry(
@@ -161,38 +320,46 @@ class DeviceService:
     
     async def get_latest_sensor_readings(self, device_id: str) -> List[SensorReading]:
         """Get latest sensor readings for a device"""
-        return await self.db_service.get_latest_sensor_readings(device_id)
+        return await self._coalesce(
+            ("latest", device_id),
+            lambda: self.db_service.get_latest_sensor_readings(device_id)
+        )
     
-    async def get_sensor_history(self, device_id: str, hours: int = 24) -> List[SensorReading]:
-        """Get sensor readings history"""
-        return await self.db_service.get_sensor_history(device_id, hours)
+    def get_sensor_history(self, device_id: str, hours: int = 24) -> AsyncIterator[Dict[str, Any]]:
+        """Stream sensor readings history"""
+        return self.db_service.get_sensor_history(device_id, hours)
     
-    async def get_system_config(self) -> Dict[str, Any]:
-        """Get system configuration"""
+    async def _initialize_default_config(self):
+        """Write default configuration values that are not present"""
         config = await self.db_service.get_all_config()
-        
-        # Add default configuration if not present
-        default_config = {
-            "watering_schedule": "daily",
-            "watering_time": "06:00",
-            "default_water_duration": "5",
-            "max_water_duration": "60",
-            "temperature_threshold": "25",
-            "humidity_threshold": "60",
-            "soil_moisture_threshold": "30"
-        }
-        
-        for key, value in default_config.items():
+        for key, value in DEFAULT_SYSTEM_CONFIG.items():
             if key not in config:
-                config[key] = value
                 await self.db_service.set_config(key, value)
+    
+    async def get_system_config(self) -> Dict[str, Any]:
+        """Get system configuration"""
+        if self._config_cache is None or time.monotonic() - self._config_cache_ts >= CONFIG_CACHE_TTL:
+            return dict(await self._coalesce("config", self._load_system_config))
         
+        return dict(self._config_cache)
+    
+    async def _load_system_config(self) -> Dict[str, Any]:
+        """Read the system configuration and refresh the cache"""
+        version = self._config_version
+        config = {**DEFAULT_SYSTEM_CONFIG, **await self.db_service.get_all_config()}
+        # Don't cache a read that raced with update_system_config
+        if version == self._config_version:
+            self._config_cache = config
+            self._config_cache_ts = time.monotonic()
         return config
     
     async def update_system_config(self, config: Dict[str, Any]):
         """Update system configuration"""
         for key, value in config.items():
             await self.db_service.set_config(key, str(value))
+        self._config_cache = None
+        self._config_version += 1
+        self._inflight.pop("config", None)
         
         # Log configuration update
         await self.db_service.add_log(LogEntry(
@@ -202,6 +369,7 @@ class DeviceService:
             details=config,
             timestamp=datetime.now()
         ))
+        self._config_changed.set()
     
     async def _handle_device_status(self, data: Dict[str, Any]):
         """Handle device status updates via MQTT"""
@@ -210,8 +378,13 @@ class DeviceService:
             status = data.get("status")
             
             if device_id and status:
+                device_status = _STATUS_BY_VALUE.get(status)
+                if device_status is None:
+                    logger.warning(f"Ignoring unknown status '{status}' from {device_id}")
+                    return
+                
                 # Update device status in database
-                await self.db_service.update_device_status(device_id, DeviceStatus(status))
+                await self._update_device_status(device_id, device_status)
                 
                 # Log status update
                 await self.db_service.add_log(LogEntry(
@@ -222,7 +395,7 @@ class DeviceService:
                     timestamp=datetime.now()
                 ))
                 
-                logger.info(f"Device {device_id} status updated: {status}")
+                logger.info("Device %s status updated: %s", device_id, status)
                 
         except Exception as e:
             logger.error(f"Error handling device status: {e}")
@@ -234,19 +407,12 @@ class DeviceService:
             readings = data.get("readings", [])
             
             if device_id and readings:
-                for reading_data in readings:
-                    reading = SensorReading(
-                        device_id=device_id,
-                        sensor_type=SensorType(reading_data["sensor_type"]),
-                        value=reading_data["value"],
-                        unit=reading_data["unit"],
-                        timestamp=datetime.fromisoformat(reading_data["timestamp"])
-                    )
-                    
-                    # Store reading in database
-                    await self.db_service.add_sensor_reading(reading)
+                sensor_readings = SensorReading.list_from_payload(device_id, readings)
                 
-                logger.info(f"Processed {len(readings)} sensor readings from {device_id}")
+                # Store all readings from this message in one batch
+                await self.db_service.add_sensor_readings_bulk(sensor_readings)
+                
+                logger.info("Processed %d sensor readings from %s", len(readings), device_id)
                 
         except Exception as e:
             logger.error(f"Error handling sensor data: {e}")
@@ -270,7 +436,7 @@ class DeviceService:
                     timestamp=datetime.now()
                 ))
                 
-                logger.info(f"Device {device_id} response: {command} - {success}")
+                logger.info("Device %s response: %s - %s", device_id, command, success)
                 
         except Exception as e:
             logger.error(f"Error handling device response: {e}")
@@ -280,10 +446,15 @@ class DeviceService:
         try:
             device_info = data.get("device_info")
             if device_info:
+                device_type = _TYPE_BY_VALUE.get(device_info["device_type"])
+                if device_type is None:
+                    logger.warning(f"Ignoring discovered device with unknown type '{device_info['device_type']}'")
+                    return
+                
                 device = Device(
                     id=device_info["id"],
                     name=device_info["name"],
-                    device_type=DeviceType(device_info["device_type"]),
+                    device_type=device_type,
                     status=DeviceStatus.ONLINE,
                     ip_address=device_info.get("ip_address"),
                     capabilities=device_info.get("capabilities", []),
@@ -301,41 +472,8 @@ class DeviceService:
         """Monitor device health and connectivity"""
         while True:
             try:
-                devices = await self.get_all_devices()
-                
-                for device in devices:
-                    # Get current device status from communication service
-                    current_status = await self._get_device_status(device.id)
-                    
-                    # Update device status if it has changed
-                    if current_status != device.status:
-                        await self.db_service.update_device_status(device.id, current_status)
-                        
-                        # Log status change
-                        await self.db_service.add_log(LogEntry(
-                            level=LogLevel.INFO if current_status == DeviceStatus.ONLINE else LogLevel.WARNING,
-                            message=f"Device status changed: {device.status.value} -> {current_status.value}",
-                            device_id=device.id,
-                            component="device_service",
-                            timestamp=datetime.now()
-                        ))
-                        
-                        logger.info(f"Device {device.id} status updated: {current_status.value}")
-                    
-                    # Also check heartbeat-based offline detection for MQTT/Serial devices
-                    if device.last_seen and current_status == DeviceStatus.ONLINE:
-                        time_since_last_seen = datetime.now() - device.last_seen
-                        if time_since_last_seen > timedelta(minutes=5):
-                            await self.db_service.update_device_status(device.id, DeviceStatus.OFFLINE)
-                            
-                            # Log device offline
-                            await self.db_service.add_log(LogEntry(
-                                level=LogLevel.WARNING,
-                                message=f"Device went offline (no heartbeat)",
-                                device_id=device.id,
-                                component="device_service",
-                                timestamp=datetime.now()
-                            ))
+                devices = await self._get_snapshot_devices()
+                await self._run_device_checks(devices, self._check_device)
                 
                 # Wait before next check
                 await asyncio.sleep(60)  # Check every minute
@@ -344,58 +482,125 @@ class DeviceService:
                 logger.error(f"Error in device monitoring: {e}")
                 await asyncio.sleep(60)
     
+    async def _run_device_checks(self, devices: List[Device],
+                                 check: Callable[[Device, datetime], Awaitable[Optional[StatusChange]]]):
+        """Check all devices concurrently and store their status changes together"""
+        # One timestamp for the whole sweep
+        now = datetime.now()
+        results = await asyncio.gather(*(check(device, now) for device in devices), return_exceptions=True)
+        
+        updates = []
+        log_entries = []
+        for device, result in zip(devices, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error checking device {device.id}: {result}")
+            elif result is not None:
+                status, log_entry = result
+                updates.append((device.id, status))
+                log_entries.append(log_entry)
+        
+        if updates:
+            await self.db_service.update_device_statuses_bulk(updates)
+            for device_id, status in updates:
+                self._status_written(device_id, status)
+            await self.db_service.add_logs_bulk(log_entries)
+    
+    async def _load_devices_snapshot(self):
+        """Refresh the device snapshot from the database"""
+        for device in await self.get_all_devices():
+            self._devices_snapshot[device.id] = device.model_copy()
+    
+    async def _get_snapshot_devices(self) -> List[Device]:
+        """Devices to check, read from the database only if none are known"""
+        if not self._devices_snapshot:
+            await self._load_devices_snapshot()
+        return list(self._devices_snapshot.values())
+    
+    async def _check_device(self, device: Device, now: datetime) -> Optional[StatusChange]:
+        """Work out one device's new status, or None if it is unchanged"""
+        # Get current device status from communication service
+        current_status = await self._get_device_status(device.id)
+        
+        # Heartbeat timeouts are handled by the timers armed in _status_written
+        if current_status == device.status:
+            return None
+        
+        logger.info(f"Device {device.id} status updated: {current_status.value}")
+        
+        return current_status, LogEntry(
+            level=LogLevel.INFO if current_status == DeviceStatus.ONLINE else LogLevel.WARNING,
+            message=f"Device status changed: {device.status.value} -> {current_status.value}",
+            device_id=device.id,
+            component="device_service",
+            timestamp=now
+        )
+    
     async def _get_device_status(self, device_id: str) -> DeviceStatus:
         """Get current device status from communication service"""
         try:
-            # Check if device is connected via communication service
-            if isinstance(self.communication_service, MixedCommunicationService):
-                if self.communication_service.is_device_connected(device_id):
-                    comm_type = self.communication_service.get_device_communication_type(device_id)
-                    
-                    if comm_type == 'dummy':
-                        # For dummy devices, get status from dummy service
-                        if self.communication_service.dummy_service:
-                            return await self.communication_service.dummy_service.get_device_status(device_id)
-                    elif comm_type in ['mqtt', 'serial']:
-                        # For MQTT/Serial devices, we'll rely on heartbeat mechanism
-                        return DeviceStatus.ONLINE
-                        
-            return DeviceStatus.OFFLINE
-            
+            return await self._status_probe(device_id)
         except Exception as e:
             logger.error(f"Error getting device status for {device_id}: {e}")
             return DeviceStatus.OFFLINE
     
+    async def _status_probe_mixed(self, device_id: str) -> DeviceStatus:
+        """Device status as seen by the mixed communication service"""
+        # Check if device is connected via communication service
+        if self.communication_service.is_device_connected(device_id):
+            comm_type = self.communication_service.get_device_communication_type(device_id)
+            
+            if comm_type == 'dummy':
+                # For dummy devices, get status from dummy service
+                if self.communication_service.dummy_service:
+                    return await self.communication_service.dummy_service.get_device_status(device_id)
+            elif comm_type in ('mqtt', 'serial'):
+                # For MQTT/Serial devices, we'll rely on heartbeat mechanism
+                return DeviceStatus.ONLINE
+        
+        return DeviceStatus.OFFLINE
+    
+    async def _status_probe_simple(self, device_id: str) -> DeviceStatus:
+        """Single-mode services report no per-device connection state"""
+        return DeviceStatus.OFFLINE
+    
     async def _initial_device_status_check(self):
         """Check device status immediately on startup"""
         try:
             # Wait a moment for services to fully initialize
             await asyncio.sleep(2)
             
-            devices = await self.get_all_devices()
-            
-            for device in devices:
-                # Get current device status from communication service
-                current_status = await self._get_device_status(device.id)
+            # Pick up devices registered before this run as well
+            await self._load_devices_snapshot()
+            devices = await self._get_snapshot_devices()
+            await self._run_device_checks(devices, self._check_initial_status)
                 
-                # Update device status if it has changed
-                if current_status != device.status:
-                    await self.db_service.update_device_status(device.id, current_status)
-                    
-                    # Log status change
-                    await self.db_service.add_log(LogEntry(
-                        level=LogLevel.INFO,
-                        message=f"Initial device status: {current_status.value}",
-                        device_id=device.id,
-                        component="device_service",
-                        timestamp=datetime.now()
-                    ))
-                    
-                    logger.info(f"Device {device.id} initial status: {current_status.value}")
-                    
         except Exception as e:
             logger.error(f"Error in initial device status check: {e}")
     
+    async def _check_initial_status(self, device: Device, now: datetime) -> Optional[StatusChange]:
+        """Work out one device's status at startup, or None if it is unchanged"""
+        # Get current device status from communication service
+        current_status = await self._get_device_status(device.id)
+        
+        # Update device status if it has changed
+        if current_status == device.status:
+            # Still online from before the restart: time out from its last_seen
+            if current_status == DeviceStatus.ONLINE and device.last_seen:
+                elapsed = (now - device.last_seen).total_seconds()
+                self._status_written(device.id, current_status, max(0.0, HEARTBEAT_TIMEOUT - elapsed))
+            return None
+        
+        logger.info(f"Device {device.id} initial status: {current_status.value}")
+        
+        # Log status change
+        return current_status, LogEntry(
+            level=LogLevel.INFO,
+            message=f"Initial device status: {current_status.value}",
+            device_id=device.id,
+            component="device_service",
+            timestamp=now
+        )
+    
     async def discover_devices(self):
         """Broadcast device discovery message"""
         try:
@@ -406,41 +611,66 @@ class DeviceService:
     
     async def start_scheduled_watering(self):
         """Start scheduled watering task"""
-        asyncio.create_task(self._scheduled_watering_task())
+        self._start_background_task(self._scheduled_watering_task())
     
     async def _scheduled_watering_task(self):
         """Scheduled watering task"""
+        target: Optional[datetime] = None
+        last_watered = None
         while True:
             try:
+                # Cleared before reading so a concurrent update is not missed
+                self._config_changed.clear()
                 config = await self.get_system_config()
                 watering_time = config.get("watering_time", "06:00")
                 
                 # Parse watering time
                 hour, minute = map(int, watering_time.split(':'))
                 
-                # Check if it's time to water
-                now = datetime.now()
-                if now.hour == hour and now.minute == minute:
-                    duration = int(config.get("default_water_duration", 5))
-                    
-                    # Send watering command
-                    success = await self.send_command(
-                        "arduino_pump", 
-                        "water_start", 
-                        {"duration": duration}
-                    )
-                    
-                    if success:
-                        await self.db_service.add_log(LogEntry(
-                            level=LogLevel.INFO,
-                            message=f"Scheduled watering started ({duration}s)",
-                            device_id="arduino_pump",
-                            component="device_service",
-                            timestamp=datetime.now()
-                        ))
+                # Next occurrence of the watering time, today or tomorrow,
+                # unless today's run already happened
+                if target is None or (target.hour, target.minute) != (hour, minute):
+                    now = datetime.now()
+                    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                    if target <= now or target.date() == last_watered:
+                        target += timedelta(days=1)
                 
-                # Wait until next minute
-                await asyncio.sleep(60)
+                # Sleep until then, starting over if the config changes first.
+                # wait_for runs on the monotonic clock, which drifts from local
+                # time across DST changes and NTP slews, so re-check the wall
+                # clock after each timeout
+                config_changed = False
+                while (now := datetime.now()) < target:
+                    try:
+                        await asyncio.wait_for(self._config_changed.wait(), (target - now).total_seconds())
+                        config_changed = True
+                        break
+                    except asyncio.TimeoutError:
+                        pass
+                if config_changed:
+                    continue
+                
+                # Advance before sending so a failure can't trigger a second run today
+                last_watered = target.date()
+                target += timedelta(days=1)
+                
+                duration = int(config.get("default_water_duration", 5))
+                
+                # Send watering command
+                success = await self.send_command(
+                    "arduino_pump", 
+                    "water_start", 
+                    {"duration": duration}
+                )
+                
+                if success:
+                    await self.db_service.add_log(LogEntry(
+                        level=LogLevel.INFO,
+                        message=f"Scheduled watering started ({duration}s)",
+                        device_id="arduino_pump",
+                        component="device_service",
+                        timestamp=datetime.now()
+                    ))
                 
             except Exception as e:
                 logger.error(f"Error in scheduled watering: {e}")
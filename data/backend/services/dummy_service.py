@@ -2,18 +2,39 @@ import asyncio
 import json
 import logging
 import random
+from collections import deque
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 from models.device import Device, DeviceStatus, SensorReading, SensorType
 
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, samples then come from the random module
+    np = None
+
 logger = logging.getLogger(__name__)
 
+# Simulated sensor values are drawn this many at a time
+SAMPLE_BUFFER_SIZE = 1024
+
+# Simulated sensors: (capability, sensor type, min value, max value, unit)
+_SENSOR_SPECS = (
+    ("temperature_reading", SensorType.TEMPERATURE, 18.0, 28.0, "°C"),
+    ("humidity_reading", SensorType.HUMIDITY, 40.0, 80.0, "%"),
+    ("soil_moisture_reading", SensorType.SOIL_MOISTURE, 20.0, 90.0, "%"),
+)
+
 class DummyService:
     """Dummy communication service for testing without hardware"""
     
     def __init__(self):
         self.devices: Dict[str, Device] = {}
         self.device_configs: Dict[str, Dict] = {}
+        # Capabilities as sets for constant-time membership checks
+        self.device_capabilities: Dict[str, frozenset] = {}
+        # Pre-drawn simulated values per (device id, sensor type)
+        self._rng = np.random.default_rng() if np is not None else None
+        self._sample_buffers: Dict[tuple, deque] = {}
         self.running = False
         
     async def initialize(self, devices: List[Device]):
@@ -24,6 +45,7 @@ class DummyService:
                 # Store device config for simulation parameters
                 device_config = device.config if device.config is not None else {}
                 self.device_configs[device.id] = device_config
+                self.device_capabilities[device.id] = frozenset(device.capabilities)
                 logger.info(f"Initialized dummy device: {device.id} ({device.name})")
             
             self.running = True
@@ -52,14 +74,16 @@ class DummyService:
         # Generate appropriate response based on command
         response = await self._generate_response(device, command, parameters or {})
         
-        logger.info(f"Dummy device {device_id} received command '{command}': {response}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Dummy device %s received command '%s': %s", device_id, command, response)
         return response
     
     async def _generate_response(self, device: Device, command: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Generate realistic response based on command and device capabilities"""
+        capabilities = self.device_capabilities.get(device.id, frozenset())
         
         if command == "water_control":
-            if "water_control" in device.capabilities:
+            if "water_control" in capabilities:
                 duration = parameters.get("duration", 5)
                 return {
                     "success": True,
@@ -72,27 +96,15 @@ class DummyService:
                 return {"success": False, "error": "Water control not supported"}
         
         elif command == "read_sensors":
-            readings = []
-            if "temperature_reading" in device.capabilities:
-                readings.append({
-                    "type": "temperature",
-                    "value": round(random.uniform(18.0, 28.0), 1),
-                    "unit": "°C"
-                })
-            
-            if "humidity_reading" in device.capabilities:
-                readings.append({
-                    "type": "humidity",
-                    "value": round(random.uniform(40.0, 80.0), 1),
-                    "unit": "%"
-                })
-            
-            if "soil_moisture_reading" in device.capabilities:
-                readings.append({
-                    "type": "soil_moisture",
-                    "value": round(random.uniform(20.0, 90.0), 1),
-                    "unit": "%"
-                })
+            readings = [
+                {
+                    "type": sensor_type.value,
+                    "value": self._next_sample(device.id, sensor_type, low, high),
+                    "unit": unit
+                }
+                for capability, sensor_type, low, high, unit in _SENSOR_SPECS
+                if capability in capabilities
+            ]
             
             return {
                 "success": True,
@@ -107,12 +119,12 @@ class DummyService:
                 "action": "status",
                 "status": "online",
                 "uptime": random.randint(3600, 86400),
-                "battery": random.randint(75, 100) if "battery" in device.capabilities else None,
+                "battery": random.randint(75, 100) if "battery" in capabilities else None,
                 "timestamp": datetime.now().isoformat()
             }
         
         elif command == "light_control":
-            if "light_control" in device.capabilities:
+            if "light_control" in capabilities:
                 state = parameters.get("state", "on")
                 brightness = parameters.get("brightness", 100)
                 return {
@@ -128,6 +140,19 @@ class DummyService:
         else:
             return {"success": False, "error": f"Unknown command: {command}"}
     
+    def _next_sample(self, device_id: str, sensor_type: SensorType, low: float, high: float) -> float:
+        """Take the next simulated value, refilling the buffer a batch at a time"""
+        buffer = self._sample_buffers.get((device_id, sensor_type))
+        if not buffer:
+            buffer = self._sample_buffers[(device_id, sensor_type)] = deque(self._draw_samples(low, high))
+        return buffer.popleft()
+    
+    def _draw_samples(self, low: float, high: float) -> List[float]:
+        """Draw SAMPLE_BUFFER_SIZE uniform values rounded to one decimal"""
+        if self._rng is not None:
+            return self._rng.uniform(low, high, SAMPLE_BUFFER_SIZE).round(1).tolist()
+        return [round(low + random.random() * (high - low), 1) for _ in range(SAMPLE_BUFFER_SIZE)]
+    
     async def get_device_status(self, device_id: str) -> DeviceStatus:
         """Get dummy device status"""
         if device_id not in self.devices:
@@ -150,41 +175,25 @@ class DummyService:
     
     async def _sensor_monitoring_loop(self, device: Device, callback):
         """Background loop to send periodic sensor readings"""
+        capabilities = self.device_capabilities.get(device.id, frozenset())
+        sensors = [spec[1:] for spec in _SENSOR_SPECS if spec[0] in capabilities]
         while self.running:
             try:
-                # Generate sensor readings
-                readings = []
-                
-                if "temperature_reading" in device.capabilities:
-                    readings.append(SensorReading(
-                        device_id=device.id,
-                        sensor_type=SensorType.TEMPERATURE,
-                        value=round(random.uniform(18.0, 28.0), 1),
-                        unit="°C",
-                        timestamp=datetime.now()
-                    ))
-                
-                if "humidity_reading" in device.capabilities:
-                    readings.append(SensorReading(
-                        device_id=device.id,
-                        sensor_type=SensorType.HUMIDITY,
-                        value=round(random.uniform(40.0, 80.0), 1),
-                        unit="%",
-                        timestamp=datetime.now()
-                    ))
-                
-                if "soil_moisture_reading" in device.capabilities:
-                    readings.append(SensorReading(
+                # Generate sensor readings, all stamped with the same time
+                now = datetime.now()
+                readings = [
+                    SensorReading(
                         device_id=device.id,
-                        sensor_type=SensorType.SOIL_MOISTURE,
-                        value=round(random.uniform(20.0, 90.0), 1),
-                        unit="%",
-                        timestamp=datetime.now()
-                    ))
+                        sensor_type=sensor_type,
+                        value=self._next_sample(device.id, sensor_type, low, high),
+                        unit=unit,
+                        timestamp=now
+                    )
+                    for sensor_type, low, high, unit in sensors
+                ]
                 
                 # Send readings via callback
-                for reading in readings:
-                    await callback(reading)
+                await asyncio.gather(*(callback(reading) for reading in readings))
                 
                 # Wait before next reading
                 await asyncio.sleep(30)  # Send readings every 30 seconds
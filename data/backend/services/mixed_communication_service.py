@@ -1,8 +1,9 @@
 import asyncio
-import json
 import logging
-from typing import Dict, Callable, Optional, Any, List
-from datetime import datetime
+from dataclasses import dataclass
+from functools import partial
+from types import MappingProxyType
+from typing import Dict, Callable, Optional, Any, List, Tuple, Mapping
 from services.config_service import config
 from services.mqtt_service import MQTTService
 from services.serial_service import SerialService
@@ -10,6 +11,18 @@ from services.dummy_service import DummyService
 
 logger = logging.getLogger(__name__)
 
+# Outbound MQTT commands are queued and sent by one writer task, which
+# drains up to MQTT_WRITE_BATCH_SIZE of them at a time
+MQTT_OUTBOUND_QUEUE_SIZE = 1024
+MQTT_WRITE_BATCH_SIZE = 64
+
+@dataclass(slots=True)
+class DeviceEntry:
+    """Everything message routing needs to know about one device"""
+    comm_type: Optional[str] = None  # set once the device is connected
+    callback: Optional[Callable] = None
+    serial: Optional[SerialService] = None
+
 class MixedCommunicationService:
     """
     Communication service that supports both MQTT and Serial devices
@@ -18,12 +31,19 @@ class MixedCommunicationService:
     
     def __init__(self):
         self.mqtt_service: Optional[MQTTService] = None
-        self.serial_connections: Dict[str, SerialService] = {}
         self.dummy_service: Optional[DummyService] = None
         self.device_configs: Dict[str, Dict[str, Any]] = {}
+        # Read-only view handed out by get_device_configs
+        self._device_configs_view = MappingProxyType(self.device_configs)
         self.message_callbacks: Dict[str, Callable] = {}
-        self.device_callbacks: Dict[str, Callable] = {}
-        self.connected_devices: Dict[str, str] = {}  # device_id -> communication_type
+        self.devices: Dict[str, DeviceEntry] = {}
+        # Message callbacks compiled for dispatch: exact topics, and
+        # "prefix/+/suffix" wildcards keyed by (prefix, suffix)
+        self._exact_callbacks: Dict[str, Callable] = {}
+        self._wild_callbacks: Dict[Tuple[str, str], Callable] = {}
+        # Queued (device_id, command, parameters, future) for the MQTT writer
+        self._mqtt_out: asyncio.Queue = asyncio.Queue(maxsize=MQTT_OUTBOUND_QUEUE_SIZE)
+        self._mqtt_writer_task: Optional[asyncio.Task] = None
         
     async def initialize(self):
         """Initialize communication services based on device configurations"""
@@ -35,10 +55,10 @@ class MixedCommunicationService:
             mqtt_devices = []
             serial_devices = []
             dummy_devices = []
+            devices_by_type = {'mqtt': mqtt_devices, 'serial': serial_devices, 'dummy': dummy_devices}
             
             for device_config in device_configs:
                 device_id = device_config.get('id')
-                comm_type = device_config.get('communication', 'mqtt')
                 
                 if not device_id:
                     logger.warning("Device configuration missing ID, skipping")
@@ -46,26 +66,22 @@ class MixedCommunicationService:
                     
                 self.device_configs[device_id] = device_config
                 
-                if comm_type == 'mqtt':
-                    mqtt_devices.append(device_config)
-                elif comm_type == 'serial':
-                    serial_devices.append(device_config)
-                elif comm_type == 'dummy':
-                    dummy_devices.append(device_config)
+                comm_type = device_config.get('communication', 'mqtt')
+                devices = devices_by_type.get(comm_type)
+                if devices is not None:
+                    devices.append(device_config)
                 else:
                     logger.warning(f"Unknown communication type '{comm_type}' for device {device_id}")
             
-            # Initialize MQTT service if needed
+            # Initialize the MQTT, Serial and Dummy services that are needed, concurrently
+            initializers = []
             if mqtt_devices:
-                await self._initialize_mqtt_service(mqtt_devices)
-            
-            # Initialize Serial services if needed
+                initializers.append(self._initialize_mqtt_service(mqtt_devices))
             if serial_devices:
-                await self._initialize_serial_services(serial_devices)
-                
-            # Initialize Dummy service if needed
+                initializers.append(self._initialize_serial_services(serial_devices))
             if dummy_devices:
-                await self._initialize_dummy_service(dummy_devices)
+                initializers.append(self._initialize_dummy_service(dummy_devices))
+            await asyncio.gather(*initializers)
                 
             logger.info(f"Mixed communication service initialized with {len(mqtt_devices)} MQTT, {len(serial_devices)} serial, and {len(dummy_devices)} dummy devices")
             
@@ -79,23 +95,24 @@ class MixedCommunicationService:
             mqtt_config = config.get_mqtt_config()
             self.mqtt_service = MQTTService(
                 broker_host=mqtt_config.get('broker_host', 'localhost'),
-                broker_port=mqtt_config.get('broker_port', 1883)
+                broker_port=mqtt_config.get('broker_port', 1883),
+                mqtt_v5=mqtt_config.get('mqtt_v5', False),
+                shared_group=mqtt_config.get('shared_subscription_group')
             )
             
-            # Set up message routing for MQTT
-            self.mqtt_service.register_message_callback("devices/+/status", self._handle_mqtt_message)
-            self.mqtt_service.register_message_callback("devices/+/sensors", self._handle_mqtt_message)
-            self.mqtt_service.register_message_callback("devices/+/response", self._handle_mqtt_message)
-            self.mqtt_service.register_message_callback("devices/+/heartbeat", self._handle_mqtt_message)
-            self.mqtt_service.register_message_callback("system/discovery", self._handle_mqtt_message)
+            # Set up message routing for MQTT, remembering which subscription matched
+            for topic in ("devices/+/status", "devices/+/sensors", "devices/+/response",
+                          "devices/+/heartbeat", "system/discovery"):
+                self.mqtt_service.register_message_callback(topic, partial(self._handle_mqtt_message, topic))
             
             await self.mqtt_service.connect()
+            self._mqtt_writer_task = asyncio.create_task(self._mqtt_writer())
             
             # Mark MQTT devices as connected
             for device in mqtt_devices:
                 device_id = device.get('id')
                 if device_id:
-                    self.connected_devices[device_id] = 'mqtt'
+                    self._device_entry(device_id).comm_type = 'mqtt'
                     logger.info(f"MQTT device registered: {device_id}")
                     
         except Exception as e:
@@ -105,42 +122,51 @@ class MixedCommunicationService:
     async def _initialize_serial_services(self, serial_devices: List[Dict[str, Any]]):
         """Initialize Serial services for USB-connected devices"""
         try:
-            for device_config in serial_devices:
+            # Open all serial ports at once; each connect waits for its board to settle
+            results = await asyncio.gather(
+                *(self._connect_serial_device(device_config) for device_config in serial_devices),
+                return_exceptions=True
+            )
+            
+            for device_config, result in zip(serial_devices, results):
                 device_id = device_config.get('id')
                 device_name = device_config.get('name', device_id or 'unknown')
                 
-                if not device_id:
-                    logger.warning("Serial device configuration missing ID, skipping")
-                    continue
-                
-                # Create custom serial service for this device
-                serial_service = SerialService()
-                
-                # Override serial config for this specific device
-                config_data = device_config.get('config', {})
-                if config_data:
-                    serial_service.serial_config = config_data
-                
-                # Set up message routing for this serial device
-                serial_service.register_message_callback(f"devices/{device_id}/status", self._handle_serial_message)
-                serial_service.register_message_callback(f"devices/{device_id}/sensors", self._handle_serial_message)
-                serial_service.register_message_callback(f"devices/{device_id}/response", self._handle_serial_message)
-                serial_service.register_message_callback(f"devices/{device_id}/heartbeat", self._handle_serial_message)
-                
-                try:
-                    await serial_service.connect()
-                    self.serial_connections[device_id] = serial_service
-                    self.connected_devices[device_id] = 'serial'
-                    logger.info(f"Serial device connected: {device_name} on {config_data.get('port', 'unknown')}")
-                    
-                except Exception as e:
-                    logger.error(f"Failed to connect to serial device {device_name}: {e}")
-                    continue
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to connect to serial device {device_name}: {result}")
+                elif result is not None:
+                    entry = self._device_entry(device_id)
+                    entry.comm_type = 'serial'
+                    entry.serial = result
+                    logger.info(f"Serial device connected: {device_name} on {result.serial_config.get('port', 'unknown')}")
                     
         except Exception as e:
             logger.error(f"Error initializing serial services: {e}")
             raise
     
+    async def _connect_serial_device(self, device_config: Dict[str, Any]) -> Optional[SerialService]:
+        """Create and connect the serial service for one device"""
+        device_id = device_config.get('id')
+        
+        if not device_id:
+            logger.warning("Serial device configuration missing ID, skipping")
+            return None
+        
+        # Create custom serial service for this device
+        serial_service = SerialService()
+        
+        # Override serial config for this specific device
+        config_data = device_config.get('config', {})
+        if config_data:
+            serial_service.serial_config = config_data
+        
+        # Set up message routing for this serial device
+        for kind in ('status', 'sensors', 'response', 'heartbeat'):
+            serial_service.register_device_message_callback(device_id, kind, self._handle_serial_message)
+        
+        await serial_service.connect()
+        return serial_service
+    
     async def _initialize_dummy_service(self, dummy_devices: List[Dict[str, Any]]):
         """Initialize Dummy service for testing without hardware"""
         try:
@@ -171,7 +197,7 @@ class MixedCommunicationService:
                 devices.append(device)
                 
                 # Mark dummy device as connected
-                self.connected_devices[device_id] = 'dummy'
+                self._device_entry(device_id).comm_type = 'dummy'
                 logger.info(f"Dummy device registered: {device_name}")
             
             # Initialize dummy service
@@ -182,22 +208,70 @@ class MixedCommunicationService:
             logger.error(f"Error initializing dummy service: {e}")
             raise
     
-    async def _handle_mqtt_message(self, data: Dict[str, Any]):
+    async def _mqtt_writer(self):
+        """Send queued MQTT commands, publishing each drained batch together"""
+        while True:
+            batch = [await self._mqtt_out.get()]
+            while len(batch) < MQTT_WRITE_BATCH_SIZE and not self._mqtt_out.empty():
+                batch.append(self._mqtt_out.get_nowait())
+            
+            results = await asyncio.gather(
+                *(self.mqtt_service.send_device_command(device_id, command, parameters)
+                  for device_id, command, parameters, _ in batch),
+                return_exceptions=True
+            )
+            for (device_id, command, _, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error sending MQTT command {command} to {device_id}: {result}")
+                    result = False
+                # The caller may have given up waiting
+                if not future.done():
+                    future.set_result(result)
+                self._mqtt_out.task_done()
+    
+    async def _send_mqtt_command(self, device_id: str, command: str, parameters: Dict[str, Any]) -> bool:
+        """Queue a command for the MQTT writer and wait for it to be sent"""
+        if self._mqtt_writer_task is None or self._mqtt_writer_task.done():
+            return await self.mqtt_service.send_device_command(device_id, command, parameters)
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._mqtt_out.put((device_id, command, parameters, future))
+        return await future
+    
+    def _device_entry(self, device_id: str) -> DeviceEntry:
+        """Get the routing entry for a device, creating it on first use"""
+        entry = self.devices.get(device_id)
+        if entry is None:
+            entry = self.devices[device_id] = DeviceEntry()
+        return entry
+    
+    def _serial_services(self) -> List[SerialService]:
+        """Serial services of all connected serial devices"""
+        return [entry.serial for entry in self.devices.values() if entry.serial is not None]
+    
+    def _find_message_callback(self, topic: str) -> Optional[Callable]:
+        """Look up the callback registered for a topic or its devices/+/type wildcard"""
+        callback = self._exact_callbacks.get(topic)
+        if callback is None:
+            prefix, _, rest = topic.partition('/')
+            _, has_suffix, suffix = rest.partition('/')
+            if has_suffix:
+                callback = self._wild_callbacks.get((prefix, suffix))
+        return callback
+    
+    async def _handle_mqtt_message(self, topic: str, data: Dict[str, Any]):
         """Handle MQTT message and route to appropriate callback"""
         try:
-            # Extract topic from message context if available
-            topic = data.get('_topic', '')
-            
             # Route to registered callbacks
-            if topic in self.message_callbacks:
-                await self.message_callbacks[topic](data)
+            callback = self._find_message_callback(topic)
+            if callback is not None:
+                await callback(data)
             
             # Route to device callbacks
-            topic_parts = topic.split('/')
-            if len(topic_parts) >= 2:
-                device_id = topic_parts[1]
-                if device_id in self.device_callbacks:
-                    await self.device_callbacks[device_id](topic, data)
+            device_id = data.get('device_id')
+            entry = self.devices.get(device_id) if device_id else None
+            if entry is not None and entry.callback is not None:
+                await entry.callback(topic.replace('+', device_id, 1), data)
                     
         except Exception as e:
             logger.error(f"Error handling MQTT message: {e}")
@@ -208,17 +282,15 @@ class MixedCommunicationService:
             device_id = data.get('device_id', 'unknown')
             message_type = data.get('type', 'unknown')
             
-            # Create topic-like structure for consistency
-            topic = f"devices/{device_id}/{message_type}"
-            
             # Route to registered callbacks
-            generic_topic = f"devices/+/{message_type}"
-            if generic_topic in self.message_callbacks:
-                await self.message_callbacks[generic_topic](data)
+            callback = self._wild_callbacks.get(("devices", message_type))
+            if callback is not None:
+                await callback(data)
             
-            # Route to device callbacks
-            if device_id in self.device_callbacks:
-                await self.device_callbacks[device_id](topic, data)
+            # Route to device callbacks, with a topic-like structure for consistency
+            entry = self.devices.get(device_id)
+            if entry is not None and entry.callback is not None:
+                await entry.callback(f"devices/{device_id}/{message_type}", data)
                 
         except Exception as e:
             logger.error(f"Error handling serial message: {e}")
@@ -226,13 +298,22 @@ class MixedCommunicationService:
     async def disconnect(self):
         """Disconnect all communication services"""
         try:
+            # Stop the MQTT writer once it has sent what is already queued
+            if self._mqtt_writer_task:
+                if not self._mqtt_writer_task.done():
+                    await self._mqtt_out.join()
+                self._mqtt_writer_task.cancel()
+                await asyncio.gather(self._mqtt_writer_task, return_exceptions=True)
+                self._mqtt_writer_task = None
+            
             # Disconnect MQTT service
             if self.mqtt_service:
                 await self.mqtt_service.disconnect()
                 
             # Disconnect all serial services
-            for device_id, serial_service in self.serial_connections.items():
-                await serial_service.disconnect()
+            await asyncio.gather(*(
+                serial_service.disconnect() for serial_service in self._serial_services()
+            ))
                 
             # Disconnect dummy service
             if self.dummy_service:
@@ -249,7 +330,8 @@ class MixedCommunicationService:
             parameters = {}
         
         try:
-            communication_type = self.connected_devices.get(device_id)
+            entry = self.devices.get(device_id)
+            communication_type = entry.comm_type if entry is not None else None
             
             if communication_type == 'dummy':
                 if self.dummy_service:
@@ -261,14 +343,14 @@ class MixedCommunicationService:
             
             elif communication_type == 'mqtt':
                 if self.mqtt_service:
-                    return await self.mqtt_service.send_device_command(device_id, command, parameters)
+                    return await self._send_mqtt_command(device_id, command, parameters)
                 else:
                     logger.error(f"MQTT service not available for device {device_id}")
                     return False
                     
             elif communication_type == 'serial':
-                if device_id in self.serial_connections:
-                    return await self.serial_connections[device_id].send_device_command(device_id, command, parameters)
+                if entry.serial is not None:
+                    return await entry.serial.send_device_command(device_id, command, parameters)
                 else:
                     logger.error(f"Serial connection not available for device {device_id}")
                     return False
@@ -284,11 +366,16 @@ class MixedCommunicationService:
     def register_message_callback(self, topic: str, callback: Callable):
         """Register callback for message topic"""
         self.message_callbacks[topic] = callback
+        parts = topic.split('/')
+        if len(parts) == 3 and parts[1] == '+':
+            self._wild_callbacks[(parts[0], parts[2])] = callback
+        else:
+            self._exact_callbacks[topic] = callback
         logger.info(f"Registered callback for topic: {topic}")
     
     def register_device_callback(self, device_id: str, callback: Callable):
         """Register callback for specific device"""
-        self.device_callbacks[device_id] = callback
+        self._device_entry(device_id).callback = callback
         logger.info(f"Registered callback for device: {device_id}")
     
     async def request_device_status(self, device_id: str) -> bool:
@@ -298,17 +385,18 @@ class MixedCommunicationService:
     async def broadcast_discovery(self):
         """Broadcast discovery message to all connected devices"""
         try:
-            success_count = 0
-            
-            # Send discovery via MQTT
+            # Send discovery via MQTT and via Serial to each connected device
+            channels = self._serial_services()
             if self.mqtt_service:
-                if await self.mqtt_service.broadcast_discovery():
-                    success_count += 1
-            
-            # Send discovery via Serial to each connected device
-            for device_id, serial_service in self.serial_connections.items():
-                if await serial_service.broadcast_discovery():
-                    success_count += 1
+                channels.append(self.mqtt_service)
+            results = await asyncio.gather(
+                *(channel.broadcast_discovery() for channel in channels),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Error broadcasting discovery on a channel: {result}")
+            success_count = sum(1 for result in results if result is True)
             
             logger.info(f"Discovery broadcast sent to {success_count} communication channels")
             return success_count > 0
@@ -321,15 +409,15 @@ class MixedCommunicationService:
         """Publish message to appropriate communication channel"""
         try:
             # Extract device ID from topic
-            topic_parts = topic.split('/')
-            if len(topic_parts) >= 2:
-                device_id = topic_parts[1]
-                communication_type = self.connected_devices.get(device_id)
+            _, has_device, rest = topic.partition('/')
+            if has_device:
+                entry = self.devices.get(rest.partition('/')[0])
+                communication_type = entry.comm_type if entry is not None else None
                 
                 if communication_type == 'mqtt' and self.mqtt_service:
                     return await self.mqtt_service.publish(topic, payload, qos)
-                elif communication_type == 'serial' and device_id in self.serial_connections:
-                    return await self.serial_connections[device_id].publish(topic, payload, qos)
+                elif communication_type == 'serial' and entry.serial is not None:
+                    return await entry.serial.publish(topic, payload, qos)
             
             logger.warning(f"Could not route message to topic: {topic}")
             return False
@@ -338,27 +426,32 @@ class MixedCommunicationService:
             logger.error(f"Error publishing message: {e}")
             return False
     
-    def get_device_configs(self) -> Dict[str, Dict[str, Any]]:
-        """Get all device configurations"""
-        return self.device_configs
+    def get_device_configs(self) -> Mapping[str, Dict[str, Any]]:
+        """Get a read-only view of all device configurations"""
+        return self._device_configs_view
     
     def get_connected_devices(self) -> Dict[str, str]:
         """Get all connected devices and their communication types"""
-        return self.connected_devices
+        return {
+            device_id: entry.comm_type
+            for device_id, entry in self.devices.items()
+            if entry.comm_type is not None
+        }
     
     def is_device_connected(self, device_id: str) -> bool:
         """Check if device is connected"""
-        return device_id in self.connected_devices
+        return self.get_device_communication_type(device_id) is not None
     
     def get_device_communication_type(self, device_id: str) -> Optional[str]:
         """Get communication type for specific device"""
-        return self.connected_devices.get(device_id)
+        entry = self.devices.get(device_id)
+        return entry.comm_type if entry is not None else None
     
     def is_connected(self) -> bool:
         """Check if any communication channel is connected"""
-        mqtt_connected = self.mqtt_service and self.mqtt_service.connected if self.mqtt_service else False
-        serial_connected = any(
-            service.is_connected() for service in self.serial_connections.values()
-        )
-        dummy_connected = self.dummy_service and self.dummy_service.running if self.dummy_service else False
-        return mqtt_connected or serial_connected or dummy_connected 
\ No newline at end of file
+        # Check the plain flags before scanning the serial services
+        if self.mqtt_service and self.mqtt_service.connected:
+            return True
+        if self.dummy_service and self.dummy_service.running:
+            return True
+        return any(service.is_connected() for service in self._serial_services()) 
\ No newline at end of file
@@ -1,45 +1,86 @@
 import asyncio
-import json
+import uuid
+import orjson
 import logging
-from typing import Dict, Callable, Optional, Any
-from datetime import datetime
-import paho.mqtt.client as mqtt
-from paho.mqtt.client import Client as MQTTClient
+from typing import Dict, Callable, Optional, Any, Tuple, List
+from gmqtt import Client as MQTTClient, Subscription
+from gmqtt.mqtt.constants import MQTTv311, MQTTv50
+from services.timestamps import iso_now
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for the broker's CONNACK before giving up
+MQTT_CONNECT_TIMEOUT = 5.0
+
+# Received messages wait in a bounded inbox for a fixed pool of workers;
+# messages arriving while it is full are dropped
+MQTT_INBOX_SIZE = 10000
+MQTT_INBOX_WORKERS = 4
+
 class MQTTService:
-    def __init__(self, broker_host: str = "localhost", broker_port: int = 1883):
+    # Device communication topics, subscribed to in one SUBSCRIBE packet
+    _TOPICS = (
+        "devices/+/status",
+        "devices/+/sensors",
+        "devices/+/response",
+        "devices/+/heartbeat",
+        "system/discovery"
+    )
+    
+    # Encoded discovery message up to the opening quote of its timestamp value
+    _DISCOVERY_PREFIX = orjson.dumps({"type": "discovery", "server": "home-iot-server"})[:-1] + b',"timestamp":"'
+    
+    def __init__(self, broker_host: str = "localhost", broker_port: int = 1883,
+                 mqtt_v5: bool = False, shared_group: Optional[str] = None):
         self.broker_host = broker_host
         self.broker_port = broker_port
+        self.mqtt_v5 = mqtt_v5
+        # Subscribe as a member of this shared subscription group, so that
+        # several server processes split the device traffic between them
+        self.shared_group = shared_group
         self.client: Optional[MQTTClient] = None
         self.connected = False
         self.message_callbacks: Dict[str, Callable] = {}
         self.device_callbacks: Dict[str, Callable] = {}
+        # Message callbacks compiled for dispatch: exact topics, and
+        # "prefix/+/suffix" wildcards keyed by (prefix, suffix)
+        self._exact_callbacks: Dict[str, Callable] = {}
+        self._wild_callbacks: Dict[Tuple[str, str], Callable] = {}
+        # Received (topic, payload) pairs and the workers that dispatch them
+        self._inbox: asyncio.Queue = asyncio.Queue(maxsize=MQTT_INBOX_SIZE)
+        self._workers: List[asyncio.Task] = []
         
     async def connect(self):
         """Connect to MQTT broker"""
         try:
-            self.client = mqtt.Client()
+            # Unique client id, so several workers don't kick each other off the broker
+            self.client = MQTTClient(f"parkme-server-{uuid.uuid4().hex[:12]}")
             self.client.on_connect = self._on_connect
             self.client.on_disconnect = self._on_disconnect
             self.client.on_message = self._on_message
             
-            # Connect to broker
-            self.client.connect(self.broker_host, self.broker_port, 60)
-            self.client.loop_start()
-            
-            # Wait for connection
-            await asyncio.sleep(1)
+            # Connect to broker; returns as soon as the broker has answered. Unless MQTT 5
+            # is configured, speaking 3.1.1 up front avoids a delayed retry against
+            # brokers without it
+            version = MQTTv50 if self.mqtt_v5 else MQTTv311
+            await asyncio.wait_for(
+                self.client.connect(self.broker_host, self.broker_port, keepalive=60, version=version),
+                timeout=MQTT_CONNECT_TIMEOUT
+            )
             
             if self.connected:
                 logger.info(f"Connected to MQTT broker at {self.broker_host}:{self.broker_port}")
                 
+                self._workers = [asyncio.create_task(self._worker()) for _ in range(MQTT_INBOX_WORKERS)]
+                
                 # Subscribe to device topics
                 await self._subscribe_to_device_topics()
             else:
                 logger.error("Failed to connect to MQTT broker")
                 
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out connecting to MQTT broker at {self.broker_host}:{self.broker_port}")
+            raise
         except Exception as e:
             logger.error(f"Error connecting to MQTT broker: {e}")
             raise
@@ -47,12 +88,16 @@ class MQTTService:
     async def disconnect(self):
         """Disconnect from MQTT broker"""
         if self.client:
-            self.client.loop_stop()
-            self.client.disconnect()
+            await self.client.disconnect()
             self.connected = False
             logger.info("Disconnected from MQTT broker")
+        
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
     
-    def _on_connect(self, client, userdata, flags, rc):
+    def _on_connect(self, client, flags, rc, properties):
         """Callback for MQTT connection"""
         if rc == 0:
             self.connected = True
@@ -61,64 +106,93 @@ class MQTTService:
             self.connected = False
             logger.error(f"MQTT connection failed with code {rc}")
     
-    def _on_disconnect(self, client, userdata, rc):
+    def _on_disconnect(self, client, packet, exc=None):
         """Callback for MQTT disconnection"""
         self.connected = False
         logger.info("MQTT connection lost")
     
-    def _on_message(self, client, userdata, msg):
-        """Callback for MQTT message"""
+    def _on_message(self, client, topic, payload, qos, properties):
+        """Callback for MQTT message; queues it for the inbox workers"""
         try:
-            topic = msg.topic
-            payload = msg.payload.decode('utf-8')
-            
-            logger.debug(f"Received MQTT message: {topic} - {payload}")
+            self._inbox.put_nowait((topic, payload))
+        except asyncio.QueueFull:
+            logger.warning(f"MQTT inbox full, dropping message on {topic}")
+        return 0
+    
+    async def _worker(self):
+        """Dispatch queued MQTT messages one at a time"""
+        while True:
+            topic, payload = await self._inbox.get()
+            try:
+                await self._dispatch(topic, payload)
+            finally:
+                self._inbox.task_done()
+    
+    async def _dispatch(self, topic: str, payload: bytes):
+        """Parse one MQTT message and hand it to the matching callbacks"""
+        try:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Received MQTT message: %s - %s", topic, payload)
             
-            # Parse JSON payload
+            # Parse JSON payload straight from the raw bytes
             try:
-                data = json.loads(payload)
-            except json.JSONDecodeError:
+                data = orjson.loads(payload)
+            except orjson.JSONDecodeError:
                 logger.warning(f"Invalid JSON in MQTT message: {payload}")
                 return
             
-            # Handle message based on topic
-            if topic in self.message_callbacks:
-                asyncio.create_task(self.message_callbacks[topic](data))
+            # Every handler expects an object; reject anything else once, here
+            if type(data) is not dict:
+                logger.warning(f"MQTT message on {topic} is not a JSON object: {payload}")
+                return
+            
+            # Handle message based on topic, slicing out only the parts we need
+            prefix, has_device, rest = topic.partition('/')
+            device_id, has_suffix, suffix = rest.partition('/')
+            callback = self._exact_callbacks.get(topic)
+            if callback is None and has_suffix:
+                callback = self._wild_callbacks.get((prefix, suffix))
+            if callback is not None:
+                await callback(data)
             
             # Handle device-specific messages
-            topic_parts = topic.split('/')
-            if len(topic_parts) >= 2:
-                device_id = topic_parts[1]
-                if device_id in self.device_callbacks:
-                    asyncio.create_task(self.device_callbacks[device_id](topic, data))
+            if has_device:
+                device_callback = self.device_callbacks.get(device_id)
+                if device_callback is not None:
+                    await device_callback(topic, data)
             
         except Exception as e:
             logger.error(f"Error processing MQTT message: {e}")
     
     async def _subscribe_to_device_topics(self):
         """Subscribe to device communication topics"""
-        topics = [
-            "devices/+/status",
-            "devices/+/sensors",
-            "devices/+/response",
-            "devices/+/heartbeat",
-            "system/discovery"
-        ]
-        
-        for topic in topics:
-            self.client.subscribe(topic)
-            logger.info(f"Subscribed to MQTT topic: {topic}")
+        prefix = f"$share/{self.shared_group}/" if self.shared_group else ""
+        topics = [prefix + topic for topic in self._TOPICS]
+        # No Local (MQTT 5 only) keeps our own discovery broadcasts from echoing back
+        self.client.subscribe([Subscription(topic, qos=0, no_local=self.mqtt_v5) for topic in topics])
+        logger.info(f"Subscribed to MQTT topics: {', '.join(topics)}")
     
     async def publish(self, topic: str, payload: Dict[str, Any], qos: int = 0):
         """Publish message to MQTT topic"""
+        try:
+            # orjson encodes straight to the bytes the client sends
+            json_payload = orjson.dumps(payload, default=str)
+        except Exception as e:
+            logger.error(f"Error publishing to MQTT: {e}")
+            return False
+        
+        return self._publish_bytes(topic, json_payload, qos)
+    
+    def _publish_bytes(self, topic: str, json_payload: bytes, qos: int = 0) -> bool:
+        """Publish an already encoded JSON payload to MQTT topic"""
         if not self.connected:
             logger.error("Cannot publish - not connected to MQTT broker")
             return False
         
         try:
-            json_payload = json.dumps(payload, default=str)
             self.client.publish(topic, json_payload, qos=qos)
-            logger.debug(f"Published to {topic}: {json_payload}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Published to %s: %s", topic, json_payload)
             return True
         except Exception as e:
             logger.error(f"Error publishing to MQTT: {e}")
@@ -133,7 +207,7 @@ class MQTTService:
         payload = {
             "command": command,
             "parameters": parameters,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": iso_now()
         }
         
         return await self.publish(topic, payload)
@@ -141,6 +215,11 @@ class MQTTService:
     def register_message_callback(self, topic: str, callback: Callable):
         """Register callback for specific topic"""
         self.message_callbacks[topic] = callback
+        parts = topic.split('/')
+        if len(parts) == 3 and parts[1] == '+':
+            self._wild_callbacks[(parts[0], parts[2])] = callback
+        else:
+            self._exact_callbacks[topic] = callback
         logger.info(f"Registered callback for topic: {topic}")
     
     def register_device_callback(self, device_id: str, callback: Callable):
@@ -154,10 +233,7 @@ class MQTTService:
     
     async def broadcast_discovery(self):
         """Broadcast discovery message to find devices"""
-        payload = {
-            "type": "discovery",
-            "timestamp": datetime.now().isoformat(),
-            "server": "home-iot-server"
-        }
+        # Only the timestamp changes, so splice it into the pre-encoded JSON
+        payload = self._DISCOVERY_PREFIX + iso_now().encode() + b'"}'
         
-        return await self.publish("system/discovery", payload) 
\ No newline at end of file
+        return self._publish_bytes("system/discovery", payload)
\ No newline at end of file
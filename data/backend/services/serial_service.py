@@ -1,24 +1,56 @@
 import asyncio
-import json
+import orjson
 import logging
+import re
 import serial
 import threading
 import time
-from typing import Dict, Callable, Optional, Any
-from datetime import datetime
+from typing import Dict, Callable, Optional, Any, Tuple
 from services.config_service import config
+from services.timestamps import iso_now
 
 logger = logging.getLogger(__name__)
 
+# Read timeout of the reader thread's blocking readline, which bounds how
+# long it takes to notice should_stop
+SERIAL_READ_TIMEOUT = 0.5
+# Lines read but not yet processed; further lines are dropped while it is full
+SERIAL_RX_QUEUE_SIZE = 1024
+# Minimum seconds between status updates forwarded for one device's heartbeats
+HEARTBEAT_MIN_INTERVAL = 1.0
+
+# Plain-text Arduino messages that map to command responses, as
+# lowercase phrase -> command, or None for a failure
+_TEXT_RESPONSES = {
+    'watering started': 'water_start',
+    'watering stopped': 'water_stop',
+    'error': None,
+}
+# All phrases in one case-insensitive pattern; when several appear, the
+# earliest entry in _TEXT_RESPONSES wins, not the earliest in the message
+_TEXT_RESPONSE_RE = re.compile('|'.join(map(re.escape, _TEXT_RESPONSES)), re.IGNORECASE)
+
 class SerialService:
     def __init__(self):
         self.serial_config = config.get_serial_config()
         self.serial_port: Optional[serial.Serial] = None
         self.connected = False
-        self.message_callbacks: Dict[str, Callable] = {}
+        self.message_callbacks: Dict[Tuple[str, str], Callable] = {}
         self.device_callbacks: Dict[str, Callable] = {}
         self.read_thread: Optional[threading.Thread] = None
         self.should_stop = False
+        # Lines handed over from the reader thread to the consumer task
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._rx_queue: asyncio.Queue = asyncio.Queue(maxsize=SERIAL_RX_QUEUE_SIZE)
+        self._consumer_task: Optional[asyncio.Task] = None
+        # JSON message type -> handler
+        self._json_handlers: Dict[str, Callable] = {
+            'response': self._handle_device_response,
+            'sensor_data': self._handle_sensor_data,
+            'status': self._handle_device_status,
+            'heartbeat': self._handle_heartbeat,
+        }
+        self._last_heartbeat: Dict[str, float] = {}
         
     async def connect(self):
         """Connect to Arduino via serial"""
@@ -32,7 +64,7 @@ class SerialService:
             self.serial_port = serial.Serial(
                 port=port,
                 baudrate=baudrate,
-                timeout=timeout,
+                timeout=SERIAL_READ_TIMEOUT,
                 write_timeout=timeout
             )
             
@@ -43,7 +75,9 @@ class SerialService:
                 self.connected = True
                 logger.info(f"Connected to Arduino on {port}")
                 
-                # Start reading thread
+                # Start the consumer task, then the reading thread that feeds it
+                self._loop = asyncio.get_running_loop()
+                self._consumer_task = asyncio.create_task(self._consume_lines())
                 self.should_stop = False
                 self.read_thread = threading.Thread(target=self._read_serial_data, daemon=True)
                 self.read_thread.start()
@@ -67,6 +101,11 @@ class SerialService:
         if self.read_thread and self.read_thread.is_alive():
             self.read_thread.join(timeout=5)
         
+        if self._consumer_task:
+            self._consumer_task.cancel()
+            await asyncio.gather(self._consumer_task, return_exceptions=True)
+            self._consumer_task = None
+        
         if self.serial_port and self.serial_port.is_open:
             self.serial_port.close()
             self.connected = False
@@ -74,32 +113,48 @@ class SerialService:
     
     def _read_serial_data(self):
         """Read data from serial port in background thread"""
+        pending = b''
         while not self.should_stop and self.serial_port and self.serial_port.is_open:
             try:
-                if self.serial_port.in_waiting > 0:
-                    line = self.serial_port.readline().decode('utf-8').strip()
-                    if line:
-                        logger.debug(f"Received serial data: {line}")
-                        asyncio.run_coroutine_threadsafe(
-                            self._process_serial_message(line),
-                            asyncio.get_event_loop()
-                        )
-                time.sleep(0.1)  # Small delay to prevent busy waiting
+                # Blocks until a full line arrives or the read timeout passes;
+                # a line cut off by the timeout is completed on the next read
+                chunk = self.serial_port.readline()
+                if not chunk.endswith(b'\n'):
+                    pending += chunk
+                    continue
+                line = (pending + chunk).decode('utf-8', 'replace').strip()
+                pending = b''
+                if line:
+                    logger.debug("Received serial data: %s", line)
+                    self._loop.call_soon_threadsafe(self._enqueue_line, line)
             except Exception as e:
                 logger.error(f"Error reading serial data: {e}")
                 time.sleep(1)
     
+    def _enqueue_line(self, line: str):
+        """Queue a line from the reader thread; runs on the event loop"""
+        try:
+            self._rx_queue.put_nowait(line)
+        except asyncio.QueueFull:
+            logger.warning(f"Serial receive queue full, dropping message: {line}")
+    
+    async def _consume_lines(self):
+        """Process received lines in order"""
+        while True:
+            line = await self._rx_queue.get()
+            await self._process_serial_message(line)
+    
     async def _process_serial_message(self, message: str):
         """Process received serial message"""
         try:
-            # Try to parse as JSON
-            if message.startswith('{') and message.endswith('}'):
-                data = json.loads(message)
-                await self._handle_json_message(data)
-            else:
-                # Handle plain text messages
+            # Lines arrive stripped and non-empty, so only a leading brace
+            # is worth a JSON parse; anything else is plain text
+            if message[0] != '{':
                 await self._handle_text_message(message)
-        except json.JSONDecodeError:
+                return
+            data = orjson.loads(message)
+            await self._handle_json_message(data)
+        except orjson.JSONDecodeError:
             logger.warning(f"Invalid JSON in serial message: {message}")
             await self._handle_text_message(message)
         except Exception as e:
@@ -110,86 +165,72 @@ class SerialService:
         message_type = data.get('type', 'unknown')
         device_id = data.get('device_id', 'arduino_device')
         
-        logger.debug(f"Processing JSON message: {message_type} from {device_id}")
+        logger.debug("Processing JSON message: %s from %s", message_type, device_id)
         
         # Route message based on type
-        if message_type == 'response':
-            await self._handle_device_response(data)
-        elif message_type == 'sensor_data':
-            await self._handle_sensor_data(data)
-        elif message_type == 'status':
-            await self._handle_device_status(data)
-        elif message_type == 'heartbeat':
-            await self._handle_heartbeat(data)
+        handler = self._json_handlers.get(message_type)
+        if handler is not None:
+            await handler(device_id, data)
         else:
             # Generic device callback
-            if device_id in self.device_callbacks:
-                await self.device_callbacks[device_id]('serial', data)
+            callback = self.device_callbacks.get(device_id)
+            if callback is not None:
+                await callback('serial', data)
     
     async def _handle_text_message(self, message: str):
         """Handle plain text message from Arduino"""
         logger.info(f"Arduino message: {message}")
         
         # Convert common text messages to structured format
-        device_id = 'arduino_device'
+        found = {phrase.lower() for phrase in _TEXT_RESPONSE_RE.findall(message)}
+        if not found:
+            return
         
-        if 'watering started' in message.lower():
-            data = {
-                'type': 'response',
-                'device_id': device_id,
-                'command': 'water_start',
-                'success': True,
-                'message': message,
-                'timestamp': datetime.now().isoformat()
-            }
-            await self._handle_device_response(data)
-        elif 'watering stopped' in message.lower():
-            data = {
-                'type': 'response',
-                'device_id': device_id,
-                'command': 'water_stop',
-                'success': True,
-                'message': message,
-                'timestamp': datetime.now().isoformat()
-            }
-            await self._handle_device_response(data)
-        elif 'error' in message.lower():
-            data = {
-                'type': 'response',
-                'device_id': device_id,
-                'success': False,
-                'message': message,
-                'timestamp': datetime.now().isoformat()
-            }
-            await self._handle_device_response(data)
+        device_id = 'arduino_device'
+        command = next(command for phrase, command in _TEXT_RESPONSES.items() if phrase in found)
+        data = {
+            'type': 'response',
+            'device_id': device_id,
+            'success': command is not None,
+            'message': message,
+            'timestamp': iso_now()
+        }
+        if command is not None:
+            data['command'] = command
+        await self._handle_device_response(device_id, data)
+    
+    async def _dispatch(self, device_id: str, suffix: str, data: Dict[str, Any]):
+        """Pass data to the callback registered for the device's topic, if any"""
+        callback = self.message_callbacks.get((device_id, suffix))
+        if callback is not None:
+            await callback(data)
     
-    async def _handle_device_response(self, data: Dict[str, Any]):
+    async def _handle_device_response(self, device_id: str, data: Dict[str, Any]):
         """Handle device command response"""
-        callback_key = f"devices/{data.get('device_id', 'unknown')}/response"
-        if callback_key in self.message_callbacks:
-            await self.message_callbacks[callback_key](data)
+        await self._dispatch(device_id, 'response', data)
     
-    async def _handle_sensor_data(self, data: Dict[str, Any]):
+    async def _handle_sensor_data(self, device_id: str, data: Dict[str, Any]):
         """Handle sensor data from Arduino"""
-        callback_key = f"devices/{data.get('device_id', 'unknown')}/sensors"
-        if callback_key in self.message_callbacks:
-            await self.message_callbacks[callback_key](data)
+        await self._dispatch(device_id, 'sensors', data)
     
-    async def _handle_device_status(self, data: Dict[str, Any]):
+    async def _handle_device_status(self, device_id: str, data: Dict[str, Any]):
         """Handle device status update"""
-        callback_key = f"devices/{data.get('device_id', 'unknown')}/status"
-        if callback_key in self.message_callbacks:
-            await self.message_callbacks[callback_key](data)
+        await self._dispatch(device_id, 'status', data)
     
-    async def _handle_heartbeat(self, data: Dict[str, Any]):
+    async def _handle_heartbeat(self, device_id: str, data: Dict[str, Any]):
         """Handle device heartbeat"""
+        now = time.monotonic()
+        if now - self._last_heartbeat.get(device_id, -HEARTBEAT_MIN_INTERVAL) < HEARTBEAT_MIN_INTERVAL:
+            return
+        self._last_heartbeat[device_id] = now
+        
         # Update device as online
         status_data = {
-            'device_id': data.get('device_id', 'arduino_device'),
+            'device_id': device_id,
             'status': 'online',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': iso_now()
         }
-        await self._handle_device_status(status_data)
+        await self._handle_device_status(device_id, status_data)
     
     async def send_command(self, device_id: str, command: str, parameters: Dict[str, Any] = None) -> bool:
         """Send command to Arduino via serial"""
@@ -207,13 +248,13 @@ class SerialService:
                 'device_id': device_id,
                 'command': command,
                 'parameters': parameters,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': iso_now()
             }
             
-            # Send as JSON
-            json_message = json.dumps(message) + '\n'
-            self.serial_port.write(json_message.encode('utf-8'))
-            self.serial_port.flush()
+            # Send as JSON in one write; orjson already produces the UTF-8 bytes.
+            # No flush(): it waits for the UART to drain, and the newline already
+            # ends the message for the Arduino
+            self.serial_port.write(orjson.dumps(message) + b'\n')
             
             logger.info(f"Sent command to Arduino: {command}")
             return True
@@ -232,8 +273,17 @@ class SerialService:
     
     def register_message_callback(self, topic: str, callback: Callable):
         """Register callback for specific topic (compatible with MQTT interface)"""
-        self.message_callbacks[topic] = callback
-        logger.info(f"Registered callback for topic: {topic}")
+        prefix, _, rest = topic.partition('/')
+        device_id, _, kind = rest.partition('/')
+        if prefix != 'devices' or not device_id or not kind or '/' in kind:
+            logger.warning(f"Ignoring callback for topic not of the form devices/<id>/<kind>: {topic}")
+            return
+        self.register_device_message_callback(device_id, kind, callback)
+    
+    def register_device_message_callback(self, device_id: str, kind: str, callback: Callable):
+        """Register callback for one kind of message (status, sensors, ...) from a device"""
+        self.message_callbacks[(device_id, kind)] = callback
+        logger.info(f"Registered callback for devices/{device_id}/{kind}")
     
     def register_device_callback(self, device_id: str, callback: Callable):
         """Register callback for specific device (compatible with MQTT interface)"""
@@ -248,7 +298,7 @@ class SerialService:
         """Broadcast discovery message to find devices"""
         return await self.send_command('all', 'discovery', {
             'server': 'home-iot-server',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': iso_now()
         })
     
     async def publish(self, topic: str, payload: Dict[str, Any], qos: int = 0):
@@ -0,0 +1,16 @@
+import time
+
+# Last formatted timestamp, reused by every message sent in the same millisecond
+_last_ts_ms = 0
+_last_ts_str = ""
+
+def iso_now() -> str:
+    """Current local time in ISO format, formatted at most once per millisecond"""
+    global _last_ts_ms, _last_ts_str
+    now = time.time()
+    ms = int(now * 1000)
+    if ms != _last_ts_ms:
+        # strftime on a struct_time skips building a datetime object
+        _last_ts_str = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now)) + f".{int(now % 1 * 1_000_000):06d}"
+        _last_ts_ms = ms
+    return _last_ts_str
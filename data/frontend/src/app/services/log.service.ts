@@ -1,7 +1,7 @@
 import { Injectable } from '@angular/core';
 import { HttpClient, HttpErrorResponse } from '@angular/common/http';
 import { Observable, BehaviorSubject, throwError } from 'rxjs';
-import { catchError, tap } from 'rxjs/operators';
+import { catchError, map, tap } from 'rxjs/operators';
 import { environment } from '../../environments/environment';
 
 export interface LogEntry {
@@ -14,6 +14,11 @@ export interface LogEntry {
   details?: any;
 }
 
+export interface LogPage {
+  items: LogEntry[];
+  next_cursor: number | null;
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -35,8 +40,9 @@ export class LogService {
       url += `&device_id=${deviceId}`;
     }
 
-    return this.http.get<LogEntry[]>(url)
+    return this.http.get<LogPage>(url)
       .pipe(
+        map(page => page.items),
         tap(logs => {
           this.logsSubject.next(logs);
           this.loadingSubject.next(false);
@@ -2,11 +2,10 @@ import subprocess
 import sys
 import os
 import json
+import paho.mqtt.client as mqtt
 
 # Adjust this path to your actual mosquitto installation path
 MOSQUITTO_PATH = r"C:\Program Files\mosquitto"
-MOSQUITTO_PUB = os.path.join(MOSQUITTO_PATH, "mosquitto_pub.exe")
-MOSQUITTO_SUB = os.path.join(MOSQUITTO_PATH, "mosquitto_sub.exe")
 MOSQUITTO_EXE = os.path.join(MOSQUITTO_PATH, "mosquitto.exe")
 
 # Path to your broker configuration file
@@ -18,6 +17,8 @@ TARGET_FILE = "mqtt_target.json"
 # MQTT broker details (must match config file)
 BROKER_HOST = "raspberrypi"
 BROKER_PORT = "1883"
+MQTT_USERNAME = "ickobombata"
+MQTT_PASSWORD = "maceradi1"
 
 # Topics (relative, we will prepend ESP ID)
 TOPICS = {
@@ -31,6 +32,9 @@ TOPICS = {
     "wifi_signal": "wifi/signal"
 }
 
+# Long-lived publisher connection, created on first publish
+_client = None
+
 
 def load_target():
     """Load the currently set ESP ID from file."""
@@ -56,37 +60,45 @@ def require_target():
     return esp_id
 
 
+def get_client():
+    """Return the shared MQTT client, connecting it on first use."""
+    global _client
+    if _client is None:
+        _client = mqtt.Client()
+        _client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        _client.connect(BROKER_HOST, int(BROKER_PORT), 60)
+        _client.loop_start()
+    return _client
+
+
 def publish(topic, message):
     """Publish a message to a topic (auto-prepend ESP ID)."""
     esp_id = require_target()
     full_topic = f"{esp_id}/{topic}"
-    cmd = [
-        MOSQUITTO_PUB,
-        "-h", BROKER_HOST,
-        "-p", BROKER_PORT,
-        "-t", full_topic,
-        "-m", str(message),
-	"-u", "ickobombata",
-	"-P", "maceradi1"
-    ]
     print(f"Publishing: topic={full_topic}, message={message}")
-    subprocess.run(cmd)
+    info = get_client().publish(full_topic, str(message), qos=0)
+    info.wait_for_publish()
+
+
+def print_message(client, userdata, msg):
+    """Print an incoming message as topic and decoded payload."""
+    print(msg.topic, msg.payload.decode(errors="replace"))
 
 
 def listen():
     """Subscribe to all topics of the current ESP ID."""
     esp_id = require_target()
     full_topic = f"{esp_id}/#"
-    cmd = [
-        MOSQUITTO_SUB,
-        "-h", BROKER_HOST,
-        "-p", BROKER_PORT,
-        "-t", full_topic,
-	"-u", "ickobombata",
-	"-P", "maceradi1"
-    ]
+    client = mqtt.Client()
+    client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+    client.on_message = print_message
+    client.connect(BROKER_HOST, int(BROKER_PORT), 60)
+    client.subscribe(full_topic)
     print(f"Listening to topics under: {full_topic}")
-    subprocess.run(cmd)
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        client.disconnect()
 
 
 def start_broker():
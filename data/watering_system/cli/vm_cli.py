@@ -2,22 +2,43 @@ import argparse
 import requests
 import os
 import json
+from functools import lru_cache
 import paho.mqtt.client as mqtt
+from requests.adapters import HTTPAdapter
 
 BASE_URL = "http://<VM_PUBLIC_IP>:8000"  # replace with your VM public IP or DNS
 CONFIG_FILE = os.path.expanduser("~/.vm_cli_config.json")
 MQTT_BROKER = "127.0.0.1"  # or your VM broker IP
 MQTT_PORT = 1883
+HTTP_TIMEOUT = (5, 10)  # (connect, read) seconds; the VM waits up to 8s on device RPCs
+
+# Keep-alive session shared by all REST calls to the VM
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+# Reused across responses instead of reconnecting for each one
+_mqtt_client = None
+
+# Parsed CONFIG_FILE, kept in sync by save_config
+_config = None
 
 def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    global _config
+    if _config is None:
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, "r") as f:
+                _config = json.load(f)
+        else:
+            _config = {}
+    return dict(_config)
 
 def save_config(config):
-    with open(CONFIG_FILE, "w") as f:
+    global _config
+    tmp_path = CONFIG_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
         json.dump(config, f)
+    os.replace(tmp_path, CONFIG_FILE)
+    _config = dict(config)
 
 def get_target():
     config = load_config()
@@ -35,7 +56,7 @@ def run_pump(seconds: int):
         print("No target device set. Use 'vm setTarget <device_id>' first.")
         return
     url = f"{BASE_URL}/pump/{target_device}/run/{seconds}"
-    r = requests.post(url)
+    r = _session.post(url, timeout=HTTP_TIMEOUT)
     print("Response:", r.json())
 
 def bucket_status():
@@ -44,7 +65,7 @@ def bucket_status():
         print("No target device set. Use 'vm setTarget <device_id>' first.")
         return
     url = f"{BASE_URL}/bucket/{target_device}/status"
-    r = requests.get(url)
+    r = _session.get(url, timeout=HTTP_TIMEOUT)
     print("Response:", r.json())
 
 def wifi_status():
@@ -53,22 +74,29 @@ def wifi_status():
         print("No target device set. Use 'vm setTarget <device_id>' first.")
         return
     url = f"{BASE_URL}/wifi/{target_device}/status"
-    r = requests.get(url)
+    r = _session.get(url, timeout=HTTP_TIMEOUT)
     print("Response:", r.json())
 
+def get_mqtt_client():
+    global _mqtt_client
+    if _mqtt_client is None:
+        _mqtt_client = mqtt.Client()
+        _mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        _mqtt_client.loop_start()
+    return _mqtt_client
+
 def publish_response(device_id, base, request_id, result):
     topic = f"devices/{device_id}/{base}/response/{request_id}"
     payload = {
         "requestId": request_id,
         "result": result
     }
-    client = mqtt.Client()
-    client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    client.publish(topic, json.dumps(payload))
-    client.disconnect()
+    info = get_mqtt_client().publish(topic, json.dumps(payload))
+    info.wait_for_publish()
     print(f"Published response to {topic}: {payload}")
 
-def main():
+@lru_cache(maxsize=1)
+def build_parser():
     parser = argparse.ArgumentParser(prog="vm", description="VM CLI to control ESP devices")
     subparsers = parser.add_subparsers(dest="command")
 
@@ -99,7 +127,11 @@ def main():
     parser_response.add_argument("request_id")
     parser_response.add_argument("result_json", help="JSON string for result payload")
 
-    args = parser.parse_args()
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
 
     if args.command == "setTarget":
         set_target(args.device_id)
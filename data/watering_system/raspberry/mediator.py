@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 import os
-import json
+import queue
 import time
 import uuid
 import threading
 import signal
-from typing import Any, Dict, Optional
+import socket
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Optional, Tuple
 
+import orjson
 import paho.mqtt.client as mqtt
 
 # =========================
@@ -25,13 +28,23 @@ VM_BROKER_PASS = os.getenv("VM_BROKER_PASS", "")
 # When VM publishes commands it uses the "devices/..." namespace.
 # Set this to "devices" to match topics like: devices/<id>/bucket/get
 VM_BASE_PREFIX = os.getenv("VM_BASE_PREFIX", "devices")
+# Topics derived from it, built once for the message handlers
+_VM_PREFIX = f"{VM_BASE_PREFIX}/"
+_MEDIATOR_DEVICES_GET = f"{VM_BASE_PREFIX}/mediator/devices/get"
+_MEDIATOR_DEVICES_RESPONSE = f"{VM_BASE_PREFIX}/mediator/devices/response/"
 
 # Where to persist the device registry (mount /data as a volume)
 REGISTRY_PATH = os.getenv("REGISTRY_PATH", "/data/devices.json")
 
 # Seconds to wait for ESP responses over local RPC
 RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "8"))
-RPC_MAX_RETRIES = float(os.getenv("RPC_TIMEOUT", "3"))    # how many times to retry on timeout
+RPC_MAX_RETRIES = int(os.getenv("RPC_MAX_RETRIES", "3"))    # how many times to retry on timeout
+RPC_MAX_PENDING = int(os.getenv("RPC_MAX_PENDING", "256"))  # oldest requests are dropped beyond this
+# Threads running VM commands, i.e. how many device RPCs can be in flight at once
+VM_COMMAND_WORKERS = int(os.getenv("VM_COMMAND_WORKERS", "16"))
+
+# Seconds to collect registry changes before writing them out in one save
+REGISTRY_SAVE_DELAY = float(os.getenv("REGISTRY_SAVE_DELAY", "1"))
 
 # =========================
 # Simple logger
@@ -43,6 +56,8 @@ def log(*args):
 # Device Registry (persisted)
 # =========================
 _device_registry: Dict[str, Dict[str, Any]] = {}
+_registry_dirty = threading.Event()
+_registry_save_lock = threading.Lock()
 
 def _ensure_registry_dir():
     os.makedirs(os.path.dirname(REGISTRY_PATH), exist_ok=True)
@@ -51,8 +66,8 @@ def load_registry():
     global _device_registry
     _ensure_registry_dir()
     try:
-        with open(REGISTRY_PATH, "r", encoding="utf-8") as f:
-            _device_registry = json.load(f)
+        with open(REGISTRY_PATH, "rb") as f:
+            _device_registry = orjson.loads(f.read())
             if not isinstance(_device_registry, dict):
                 _device_registry = {}
         log(f"Loaded device registry with {len(_device_registry)} entries.")
@@ -64,19 +79,42 @@ def load_registry():
         log("Failed to load registry:", e)
 
 def save_registry():
-    _ensure_registry_dir()
-    tmp_path = REGISTRY_PATH + ".tmp"
-    try:
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            json.dump(_device_registry, f, indent=2, ensure_ascii=False)
-        os.replace(tmp_path, REGISTRY_PATH)
-        log(f"Saved device registry ({len(_device_registry)} devices).")
-    except Exception as e:
-        log("Failed to save registry:", e)
+    with _registry_save_lock:
+        _ensure_registry_dir()
+        tmp_path = REGISTRY_PATH + ".tmp"
+        try:
+            data = orjson.dumps(_device_registry, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, REGISTRY_PATH)
+            log(f"Saved device registry ({len(_device_registry)} devices).")
+        except Exception as e:
+            log("Failed to save registry:", e)
+
+def mark_registry_dirty():
+    """Schedule a registry save; bursts of changes are written once."""
+    _registry_dirty.set()
+
+def _registry_saver():
+    while True:
+        _registry_dirty.wait()
+        time.sleep(REGISTRY_SAVE_DELAY)
+        _registry_dirty.clear()
+        save_registry()
 
 # =========================
 # RPC Wrapper (local broker)
 # =========================
+# Response topics for every RPC base
+RPC_RESPONSE_TOPICS = [
+    ("+/bucket/response/+", 0),
+    ("+/pump/response/+", 0),
+    ("+/wifi/response/+", 0),
+    ("+/config/response/+", 0),
+]
+# Seconds between sweeps for pending requests past their deadline
+RPC_SWEEP_INTERVAL = 5.0
+
 class MqttRpcClient:
     """
     Lightweight RPC over MQTT with requestId and retry support.
@@ -87,45 +125,52 @@ class MqttRpcClient:
         deviceA/bucket/get   with payload {"requestId":"..."}
     - Wait on response at:  <device_id>/<base>/response/<requestId>
       where <base> is the first segment of method_topic (e.g., "pump", "bucket")
+
+    Shares the local broker connection: the owner subscribes to
+    RPC_RESPONSE_TOPICS and passes responses to resolve().
     """
-    def __init__(self,
-                 host: str,
-                 port: int = 1883,
-                 username: str = "",
-                 password: str = ""):
-        self.client = mqtt.Client(client_id=f"rpc_{uuid.uuid4().hex[:8]}")
-        if username or password:
-            self.client.username_pw_set(username, password)
-        self.client.on_message = self._on_message
-        self.client.on_connect = self._on_connect
-        self.client.on_disconnect = self._on_disconnect
-
-        self.pending: Dict[str, Dict[str, Any]] = {}
-        self._lock = threading.Lock()
-
-        self.client.connect(host, port, keepalive=60)
-        self.client.loop_start()
-        log(f"RPC connected to local broker {host}:{port}")
-
-    def _on_connect(self, client, userdata, flags, rc):
-        log(f"[rpc] connected, rc={rc}")
-
-    def _on_disconnect(self, client, userdata, rc):
-        log(f"[rpc] disconnected, rc={rc}")
-
-    def _on_message(self, client, userdata, msg):
+    def __init__(self, client: mqtt.Client):
+        self.client = client
+
+        # requestId -> (Future, deadline); single dict operations are atomic,
+        # so the network thread and callers share it without a lock
+        self.pending: Dict[str, Tuple[Future, float]] = {}
+        threading.Thread(target=self._sweep_pending, name="rpc-sweeper", daemon=True).start()
+
+    def resolve(self, req_id: str, payload: bytes):
+        """Complete the pending call for req_id with a raw response payload."""
+        # Late or duplicate responses nobody waits for any more are dropped
+        # without being parsed
+        if req_id not in self.pending:
+            return
         try:
-            payload = json.loads(msg.payload.decode())
+            payload = orjson.loads(payload)
         except Exception:
             return
-        req_id = payload.get("requestId")
-        if not req_id:
-            return
-        with self._lock:
-            entry = self.pending.get(req_id)
-            if entry:
-                entry["response"] = payload
-                entry["event"].set()
+        entry = self.pending.pop(req_id, None)
+        if entry is not None and not entry[0].done():
+            entry[0].set_result(payload)
+
+    def _add_pending(self, req_id: str, fut: Future, timeout: float):
+        if len(self.pending) >= RPC_MAX_PENDING:
+            # Dicts keep insertion order, so the first key is the oldest request
+            for oldest in list(self.pending)[:1]:
+                self._fail_pending(oldest, "too many pending requests")
+        self.pending[req_id] = (fut, time.monotonic() + timeout * RPC_MAX_RETRIES)
+
+    def _fail_pending(self, req_id: str, reason: str):
+        # Whoever pops the entry owns it, so this never races resolve()
+        entry = self.pending.pop(req_id, None)
+        if entry is not None and not entry[0].done():
+            entry[0].set_exception(TimeoutError(f"RPC {req_id} dropped: {reason}"))
+
+    def _sweep_pending(self):
+        while True:
+            time.sleep(RPC_SWEEP_INTERVAL)
+            now = time.monotonic()
+            for req_id, (_, deadline) in list(self.pending.items()):
+                if deadline < now:
+                    self._fail_pending(req_id, "deadline passed")
 
     def call(self,
              device_id: str,
@@ -137,32 +182,26 @@ class MqttRpcClient:
         method_topic example: "bucket/get", "pump/run", "wifi/get", "pump/get", "config/name"
         """
         last_error = None
+        # Only the requestId changes between attempts; the envelope is local
+        # to this call, so updating it in place is safe
+        request_topic = f"{device_id}/{method_topic}"
+        payload = {"requestId": None, "params": params or {}}
         for attempt in range(1, RPC_MAX_RETRIES + 1):
+            req_id = uuid.uuid4().hex
+            fut = Future()
             try:
-                base = method_topic.split("/", 1)[0]  # "pump" from "pump/run"
-                req_id = uuid.uuid4().hex
-                event = threading.Event()
-                with self._lock:
-                    self.pending[req_id] = {"event": event, "response": None}
-
-                response_topic = f"{device_id}/{base}/response/{req_id}"
-                request_topic  = f"{device_id}/{method_topic}"
+                self._add_pending(req_id, fut, timeout)
 
-                # subscribe to response topic for this request only
-                self.client.subscribe(response_topic)
-
-                payload = {"requestId": req_id, "params": params or {}}
-                self.client.publish(request_topic, json.dumps(payload))
+                payload["requestId"] = req_id
+                self.client.publish(request_topic, orjson.dumps(payload), qos=1)
                 log(f"[rpc] attempt {attempt}/{RPC_MAX_RETRIES} → {request_topic} {payload}")
 
-                if event.wait(timeout):
-                    with self._lock:
-                        resp = self.pending.pop(req_id, None)
-                    if not resp or not resp.get("response"):
-                        raise TimeoutError("Response missing after event set")
-                    return resp["response"].get("result")
-                else:
-                    raise TimeoutError(f"RPC timeout waiting for {response_topic}")
+                try:
+                    response = fut.result(timeout)
+                except FutureTimeoutError:
+                    base = method_topic.partition("/")[0]  # "pump" from "pump/run"
+                    raise TimeoutError(f"RPC timeout waiting for {device_id}/{base}/response/{req_id}") from None
+                return response.get("result")
 
             except TimeoutError as e:
                 log(f"[rpc] timeout on attempt {attempt}/{RPC_MAX_RETRIES}")
@@ -174,7 +213,8 @@ class MqttRpcClient:
                 break  # non-timeout error → no retry
 
             finally:
-                with self._lock:
+                # A completed future was already popped by whoever completed it
+                if not fut.done():
                     self.pending.pop(req_id, None)
 
         # If we got here, all retries failed
@@ -203,10 +243,34 @@ local_mqtt = None  # type: Optional[mqtt.Client]
 vm_mqtt = None     # type: Optional[mqtt.Client]
 rpc = None         # type: Optional[MqttRpcClient]
 
-def build_client(client_id: str, host: str, port: int, user: str, pwd: str):
+# Runs VM commands off the VM client's network thread, which would
+# otherwise stall on every device RPC
+_vm_command_pool = ThreadPoolExecutor(max_workers=VM_COMMAND_WORKERS, thread_name_prefix="rpc-cmd")
+
+# (topic, payload, qos) waiting to be published upstream by _vm_publisher
+_vm_outbox = queue.SimpleQueue()
+
+def _set_nodelay(client, userdata, sock):
+    # RPC frames are a few hundred bytes at most; without this, Nagle holds
+    # them back waiting for the peer's delayed ACK
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (OSError, AttributeError) as e:
+        log("Could not set TCP_NODELAY:", e)
+
+def build_client(client_id: str, host: str, port: int, user: str, pwd: str, topics, on_message):
     c = mqtt.Client(client_id=client_id, clean_session=True)
     if user or pwd:
         c.username_pw_set(user, pwd)
+    c.on_message = on_message
+    c.on_socket_open = _set_nodelay
+
+    # Clean sessions drop subscriptions, so send them (as one SUBSCRIBE)
+    # on every (re)connect
+    def on_connect(client, userdata, flags, rc):
+        log(f"[{client_id}] connected, rc={rc}")
+        client.subscribe(topics)
+    c.on_connect = on_connect
     # Robust options
     c.reconnect_delay_set(min_delay=1, max_delay=30)
     c.max_inflight_messages_set(64)
@@ -217,62 +281,70 @@ def build_client(client_id: str, host: str, port: int, user: str, pwd: str):
     return c
 
 # ---------------- Local broker message handler ----------------
+# Status topics forwarded upstream unchanged, and the bases whose RPC responses are forwarded
+_STATUS_SUFFIXES = ("/bucket/status", "/pump/status", "/wifi/status")
+_RESPONSE_BASES = frozenset(("bucket", "pump", "wifi", "config"))
+
 def on_local_message(client, userdata, msg):
     topic = msg.topic
     payload = msg.payload  # forward as-is for status/announce
     # 1) device announces
     if topic == "devices/announce":
         try:
-            data = json.loads(payload.decode())
+            data = orjson.loads(payload)
             dev_id = data.get("id")
             if dev_id:
                 _device_registry[dev_id] = data
-                save_registry()
+                mark_registry_dirty()
                 log(f"[local] announce from {dev_id} -> forwarded to VM")
             else:
                 log("[local] announce missing id, forwarding anyway")
         except Exception as e:
             log("[local] announce parse error:", e)
         # Forward upstream
-        safe_publish_vm("devices/announce", payload)
+        safe_publish_vm("devices/announce", payload, qos=0)
         return
 
     # 2) status topics — forward upstream unchanged
-    if topic.endswith("/bucket/status") or topic.endswith("/pump/status") or topic.endswith("/wifi/status"):
+    if topic.endswith(_STATUS_SUFFIXES):
         log(f"[local] forward status {topic} -> VM")
-        safe_publish_vm(topic, payload)
+        safe_publish_vm(topic, payload, qos=0)
         return
 
     # 3) RPC responses (JSON) — forward upstream with VM prefix
     # Pattern: <device_id>/<base>/response/<requestId>
     # We wrap it with "devices/" prefix to keep cloud namespace consistent.
-    parts = topic.split("/")
-    if len(parts) >= 4 and parts[1] in ("bucket", "pump", "wifi", "config") and parts[2] == "response":
-        vm_topic = f"{VM_BASE_PREFIX}/{topic}"  # e.g., devices/esp32c3_abcd/pump/response/<reqId>
+    _, _, rest = topic.partition("/")
+    base, _, rest = rest.partition("/")
+    kind, sep, req_id = rest.partition("/")
+    if sep and kind == "response" and base in _RESPONSE_BASES:
+        # Answers to our own RPC calls arrive here too
+        if rpc is not None:
+            rpc.resolve(req_id, payload)
+        vm_topic = _VM_PREFIX + topic  # e.g., devices/esp32c3_abcd/pump/response/<reqId>
         log(f"[local] forward RPC response {topic} -> {vm_topic}")
-        safe_publish_vm(vm_topic, payload)
+        safe_publish_vm(vm_topic, payload, qos=1)
 
 # ---------------- VM broker message handler ----------------
 def on_vm_message(client, userdata, msg):
-    """Receive commands from VM and execute via local RPC, then publish a response back to VM."""
+    """Receive commands from VM and queue them for _run_vm_command."""
     topic = msg.topic
     try:
-        payload = json.loads(msg.payload.decode())
+        payload = orjson.loads(msg.payload)
     except Exception:
         log(f"[vm] non-JSON payload on {topic}; ignoring")
         return
 
     req_id = payload.get("requestId", "")
     params = payload.get("params", {}) or {}
-    parts = topic.split("/")
 
     # --- Handle devices/mediator/devices/get ---
-    if topic == f"{VM_BASE_PREFIX}/mediator/devices/get":
+    if topic == _MEDIATOR_DEVICES_GET:
         # Respond with all devices in the registry
-        resp_topic = f"{VM_BASE_PREFIX}/mediator/devices/response/{req_id}"
+        resp_topic = f"{_MEDIATOR_DEVICES_RESPONSE}{req_id}"
         result = list(_device_registry.values())
         resp = {"requestId": req_id, "result": result}
-        safe_publish_vm(resp_topic, json.dumps(resp).encode())
+        safe_publish_vm(resp_topic, orjson.dumps(resp), qos=1)
         log(f"[vm] Sent device registry to {resp_topic}")
         return
 
@@ -280,14 +352,17 @@ def on_vm_message(client, userdata, msg):
     #   devices/<device_id>/<segment>/get
     #   devices/<device_id>/pump/run
     #   devices/<device_id>/config/name
-    if len(parts) < 4 or parts[0] != VM_BASE_PREFIX:
+    prefix, _, rest = topic.partition("/")
+    device_id, _, method_topic = rest.partition("/")  # e.g., "pump/run", "bucket/get"
+    base, sep, _ = method_topic.partition("/")         # "pump", "bucket", ...
+    if not sep or prefix != VM_BASE_PREFIX:
         log(f"[vm] Unexpected topic: {topic}")
         return
 
-    device_id = parts[1]
-    method_topic = "/".join(parts[2:])  # e.g., "pump/run", "bucket/get"
-    base = parts[2]                     # "pump", "bucket", ...
+    _vm_command_pool.submit(_run_vm_command, device_id, method_topic, base, req_id, params)
 
+def _run_vm_command(device_id: str, method_topic: str, base: str, req_id: str, params: Dict[str, Any]):
+    """Execute a VM command via local RPC (on a pool thread), then publish a response back to VM."""
     # Call local RPC
     try:
         result = rpc.call(device_id, method_topic, params=params, timeout=RPC_TIMEOUT)
@@ -298,14 +373,23 @@ def on_vm_message(client, userdata, msg):
 
     # Publish response back to VM broker at:
     #   devices/<device_id>/<base>/response/<requestId>
-    vm_resp_topic = f"{VM_BASE_PREFIX}/{device_id}/{base}/response/{req_id or 'noid'}"
-    safe_publish_vm(vm_resp_topic, json.dumps(resp).encode())
+    vm_resp_topic = f"{_VM_PREFIX}{device_id}/{base}/response/{req_id or 'noid'}"
+    safe_publish_vm(vm_resp_topic, orjson.dumps(resp), qos=1)
 
-def safe_publish_vm(topic: str, payload: bytes):
-    try:
-        vm_mqtt.publish(topic, payload)
-    except Exception as e:
-        log("[vm] publish failed:", e)
+def safe_publish_vm(topic: str, payload: bytes, qos: int = 0):
+    """Queue a publish to the VM broker; QoS 0 for best-effort forwards, 1 for RPC responses."""
+    _vm_outbox.put((topic, payload, qos))
+
+def _vm_publisher():
+    # Sole caller of vm_mqtt.publish, so the local network thread and the
+    # command pool never contend for the VM client's locks; a burst of
+    # forwards is drained back to back
+    while True:
+        topic, payload, qos = _vm_outbox.get()
+        try:
+            vm_mqtt.publish(topic, payload, qos=qos)
+        except Exception as e:
+            log("[vm] publish failed:", e)
 
 # =========================
 # Wiring it all together
@@ -314,51 +398,51 @@ def main():
     global local_mqtt, vm_mqtt, rpc
 
     load_registry()
+    threading.Thread(target=_registry_saver, name="registry-saver", daemon=True).start()
 
     # Local (ESP) broker
     local_mqtt = build_client(
         client_id=f"pi_local_{uuid.uuid4().hex[:6]}",
         host=LOCAL_BROKER_HOST, port=LOCAL_BROKER_PORT,
-        user=LOCAL_BROKER_USER, pwd=LOCAL_BROKER_PASS
+        user=LOCAL_BROKER_USER, pwd=LOCAL_BROKER_PASS,
+        # Subscriptions for ESP-originated traffic
+        topics=[
+            ("devices/announce", 0),
+            ("+/bucket/status", 0),
+            ("+/pump/status", 0),
+            ("+/wifi/status", 0),
+            # RPC responses, both for our own calls and to forward upstream (if VM subscribed
+            # directly they’d arrive via bridge, but we forward explicitly to enforce consistent VM prefix)
+            *RPC_RESPONSE_TOPICS,
+        ],
+        on_message=on_local_message
     )
-    local_mqtt.on_message = on_local_message
-    # Subscriptions for ESP-originated traffic
-    local_mqtt.subscribe("devices/announce")
-    local_mqtt.subscribe("+/bucket/status")
-    local_mqtt.subscribe("+/pump/status")
-    local_mqtt.subscribe("+/wifi/status")
-    # Also catch RPC responses to forward upstream (if VM subscribed directly they’d arrive via bridge,
-    # but we forward explicitly to enforce consistent VM prefix)
-    local_mqtt.subscribe("+/bucket/response/+")
-    local_mqtt.subscribe("+/pump/response/+")
-    local_mqtt.subscribe("+/wifi/response/+")
-    local_mqtt.subscribe("+/config/response/+")
+
+    # Local RPC client used to talk to ESPs, over the same connection
+    rpc = MqttRpcClient(local_mqtt)
 
     # VM (cloud) broker
     vm_mqtt = build_client(
         client_id=f"pi_vm_{uuid.uuid4().hex[:6]}",
         host=VM_BROKER_HOST, port=VM_BROKER_PORT,
-        user=VM_BROKER_USER, pwd=VM_BROKER_PASS
-    )
-    vm_mqtt.on_message = on_vm_message
-    # Commands coming from the cloud
-    vm_mqtt.subscribe(f"{VM_BASE_PREFIX}/+/pump/run")
-    vm_mqtt.subscribe(f"{VM_BASE_PREFIX}/+/bucket/get")
-    vm_mqtt.subscribe(f"{VM_BASE_PREFIX}/+/wifi/get")
-    vm_mqtt.subscribe(f"{VM_BASE_PREFIX}/+/pump/get")
-    vm_mqtt.subscribe(f"{VM_BASE_PREFIX}/+/config/name")
-
-    # Local RPC client used to talk to ESPs
-    rpc = MqttRpcClient(
-        host=LOCAL_BROKER_HOST,
-        port=LOCAL_BROKER_PORT,
-        username=LOCAL_BROKER_USER,
-        password=LOCAL_BROKER_PASS
+        user=VM_BROKER_USER, pwd=VM_BROKER_PASS,
+        # Commands coming from the cloud
+        topics=[
+            (f"{VM_BASE_PREFIX}/+/pump/run", 0),
+            (f"{VM_BASE_PREFIX}/+/bucket/get", 0),
+            (f"{VM_BASE_PREFIX}/+/wifi/get", 0),
+            (f"{VM_BASE_PREFIX}/+/pump/get", 0),
+            (f"{VM_BASE_PREFIX}/+/config/name", 0),
+            (_MEDIATOR_DEVICES_GET, 0),
+        ],
+        on_message=on_vm_message
     )
+    threading.Thread(target=_vm_publisher, name="vm-publisher", daemon=True).start()
 
     # Graceful shutdown to save registry
     def handle_sig(signum, frame):
         log(f"Signal {signum} received, saving registry and exiting.")
+        _vm_command_pool.shutdown(wait=False, cancel_futures=True)
         save_registry()
         # keep container alive unless actually asked to stop by Docker
         os._exit(0)
@@ -366,9 +450,10 @@ def main():
     signal.signal(signal.SIGINT, handle_sig)
 
     log("Mediator running. Bridging local <-> VM.")
-    # Run forever
+    # Run forever; MQTT runs on its own threads, so just sleep until a
+    # signal arrives (handle_sig exits the process)
     while True:
-        time.sleep(1)
+        signal.pause()
 
 if __name__ == "__main__":
     main()
@@ -1,50 +1,56 @@
 import paho.mqtt.client as mqtt
 import uuid
-import json
-import threading
+import orjson
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 
 class MqttRpcClient:
     def __init__(self, broker="localhost", base_prefix=""):
+        self.pending = {}
+        self.base_prefix = base_prefix.rstrip("/")
+
         self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.client.connect(broker)
         self.client.loop_start()
 
-        self.pending = {}
-        self.base_prefix = base_prefix.rstrip("/")
+    def _on_connect(self, client, userdata, flags, rc):
+        # Subscribe on every (re)connect so responses survive a broker restart
+        client.subscribe(f"{self.base_prefix}/+/+/response/+")
 
     def _on_message(self, client, userdata, msg):
+        # The topic ends with the requestId; skip parsing unawaited responses
+        req_id = msg.topic.rpartition("/")[2]
+        if req_id not in self.pending:
+            return
         try:
-            payload = json.loads(msg.payload.decode())
-            req_id = payload.get("requestId")
-            if req_id in self.pending:
-                self.pending[req_id]["response"] = payload
-                self.pending[req_id]["event"].set()
+            payload = orjson.loads(msg.payload)
         except Exception as e:
             print("Error in on_message:", e)
+            return
+        fut = self.pending.pop(req_id, None)
+        if fut is not None and not fut.done():
+            fut.set_result(payload)
 
     def call(self, device_id, method, params=None, timeout=5):
         """
         Make an RPC call to a device.
         """
         req_id = str(uuid.uuid4())
-        event = threading.Event()
-        self.pending[req_id] = {"event": event, "response": None}
-
-        response_topic = f"{self.base_prefix}/{device_id}/{method}/response/{req_id}"
-        self.client.subscribe(response_topic)
+        fut = Future()
+        self.pending[req_id] = fut
 
         request_topic = f"{self.base_prefix}/{device_id}/{method}/get"
         payload = {"requestId": req_id, "params": params or {}}
-        self.client.publish(request_topic, json.dumps(payload))
-
-        if event.wait(timeout):
-            resp = self.pending[req_id]["response"]
-            del self.pending[req_id]
-            return resp.get("result")
-        else:
-            del self.pending[req_id]
-            raise TimeoutError(f"No response from {device_id} for {method}")
+        self.client.publish(request_topic, orjson.dumps(payload))
+
+        try:
+            resp = fut.result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"No response from {device_id} for {method}") from None
+        finally:
+            self.pending.pop(req_id, None)
+        return resp.get("result")
 
     def __getattr__(self, name):
         """
@@ -1,8 +1,8 @@
 import asyncio
-import json
 import uuid
 from typing import Dict, Any
 
+import orjson
 import paho.mqtt.client as mqtt
 from fastapi import FastAPI, HTTPException
 
@@ -31,33 +31,40 @@ class AsyncMqttRpcClient:
 
     def _on_connect(self, client, userdata, flags, rc):
         print(f"✅ Connected to MQTT broker rc={rc}")
+        # One wildcard subscription covers every RPC response
+        client.subscribe("devices/+/+/response/+")
 
     def _on_message(self, client, userdata, msg):
+        # The topic ends with the requestId, so responses nobody waits for
+        # any more are dropped without being parsed
+        req_id = msg.topic.rpartition("/")[2]
+        if req_id not in self.pending:
+            return
         try:
-            payload = json.loads(msg.payload.decode())
-            req_id = payload.get("requestId")
+            payload = orjson.loads(msg.payload)
         except Exception:
             return
 
-        if req_id and req_id in self.pending:
-            fut = self.pending.pop(req_id)
-            if not fut.done():
-                fut.set_result(payload)
+        # Runs on paho's network thread: hand the result to the future's own
+        # loop so the awaiting request wakes up right away
+        fut = self.pending.pop(req_id, None)
+        if fut is not None:
+            fut.get_loop().call_soon_threadsafe(self._resolve, fut, payload)
+
+    @staticmethod
+    def _resolve(fut: asyncio.Future, payload: Any):
+        if not fut.done():
+            fut.set_result(payload)
 
     async def call(self, device_id: str, method: str, params: Dict[str, Any] = None, timeout: int = RPC_TIMEOUT):
         req_id = uuid.uuid4().hex
-        fut = asyncio.get_event_loop().create_future()
+        fut = asyncio.get_running_loop().create_future()
         self.pending[req_id] = fut
 
-        # Subscribe to this response topic
-        base = method.split("/", 1)[0]
-        resp_topic = f"devices/{device_id}/{base}/response/{req_id}"
-        self.client.subscribe(resp_topic)
-
         # Publish request
         topic = f"devices/{device_id}/{method}"
         payload = {"requestId": req_id, "params": params or {}}
-        self.client.publish(topic, json.dumps(payload))
+        self.client.publish(topic, orjson.dumps(payload))
         print(f"[rpc] → {topic} {payload}")
 
         try: